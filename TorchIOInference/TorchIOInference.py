@@ -0,0 +1,349 @@
+import time
+import logging
+import traceback
+from pathlib import Path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import qt
+import ctk
+import slicer
+from slicer.ScriptedLoadableModule import (
+  ScriptedLoadableModule,
+  ScriptedLoadableModuleWidget,
+  ScriptedLoadableModuleTest,
+)
+
+from TorchIOModule import TorchIOModuleLogic, MRML_LABEL, MRML_SCALAR
+from TorchIOTransformsLib.CoordinatesWidget import CoordinatesWidget
+
+
+class TorchIOInference(ScriptedLoadableModule):
+
+  def __init__(self, parent):
+    ScriptedLoadableModule.__init__(self, parent)
+    self.parent.title = 'TorchIO Inference'
+    self.parent.categories = ['Utilities']
+    self.parent.dependencies = ['TorchIOTransforms']
+    self.parent.contributors = [
+      'Fernando Perez-Garcia'
+      ' (University College London and King\'s College London)'
+    ]
+    self.parent.helpText = (
+      'This module can be used to run a TorchScript model on a volume using'
+      ' patch-based inference. Patches are sampled on a grid and the model'
+      ' outputs are aggregated into a label map or a scalar volume.\n\n'
+    )
+    self.parent.helpText += self.getDefaultModuleDocumentationLink()
+    self.parent.acknowledgementText = (
+      'This work was was funded by the Engineering and Physical Sciences'
+      ' Research Council (EPSRC) and supported by the UCL Centre for Doctoral'
+      ' Training in Intelligent, Integrated Imaging in Healthcare, the UCL'
+      ' Wellcome / EPSRC Centre for Interventional and Surgical Sciences (WEISS),'
+      ' and the School of Biomedical Engineering & Imaging Sciences (BMEIS)'
+      " of King's College London."
+    )
+
+  def getDefaultModuleDocumentationLink(self):
+    docsUrl = 'https://torchio.readthedocs.io/patches/patch_inference.html'
+    linkText = f'See <a href="{docsUrl}">the documentation</a> for more information.'
+    return linkText
+
+
+class TorchIOInferenceWidget(ScriptedLoadableModuleWidget):
+
+  def setup(self):
+    ScriptedLoadableModuleWidget.setup(self)
+    self.logic = TorchIOInferenceLogic()
+    if self.logic.torchio is None: # make sure PyTorch and TorchIO are installed
+      return
+    self.makeGUI()
+    self.onSelectorModified()
+
+  def makeGUI(self):
+    self.addNodesButton()
+    self.addModelButton()
+    self.addRunButton()
+    # Add vertical spacer
+    self.layout.addStretch(1)
+
+  def addNodesButton(self):
+    self.nodesButton = ctk.ctkCollapsibleButton()
+    self.nodesButton.text = 'Volumes'
+    self.layout.addWidget(self.nodesButton)
+    nodesLayout = qt.QFormLayout(self.nodesButton)
+
+    self.inputSelector = slicer.qMRMLNodeComboBox()
+    self.inputSelector.nodeTypes = [MRML_SCALAR]
+    self.inputSelector.addEnabled = False
+    self.inputSelector.removeEnabled = True
+    self.inputSelector.noneEnabled = False
+    self.inputSelector.setMRMLScene(slicer.mrmlScene)
+    self.inputSelector.currentNodeChanged.connect(self.onSelectorModified)
+    nodesLayout.addRow('Input volume: ', self.inputSelector)
+
+    self.outputSelector = slicer.qMRMLNodeComboBox()
+    self.outputSelector.nodeTypes = [MRML_LABEL, MRML_SCALAR]
+    self.outputSelector.selectNodeUponCreation = False
+    self.outputSelector.addEnabled = False
+    self.outputSelector.removeEnabled = True
+    self.outputSelector.noneEnabled = True
+    self.outputSelector.setMRMLScene(slicer.mrmlScene)
+    self.outputSelector.noneDisplay = 'Create new volume'
+    self.outputSelector.currentNodeChanged.connect(self.onSelectorModified)
+    nodesLayout.addRow('Output volume: ', self.outputSelector)
+
+    self.outputTypeComboBox = qt.QComboBox()
+    self.outputTypeComboBox.addItems(['Label map', 'Scalar volume'])
+    self.outputTypeComboBox.setToolTip('Type of the new output volume')
+    nodesLayout.addRow('Output type: ', self.outputTypeComboBox)
+
+  def addModelButton(self):
+    self.modelButton = ctk.ctkCollapsibleButton()
+    self.modelButton.text = 'Model'
+    self.layout.addWidget(self.modelButton)
+    modelLayout = qt.QFormLayout(self.modelButton)
+
+    self.modelPathLineEdit = ctk.ctkPathLineEdit()
+    self.modelPathLineEdit.nameFilters = ['TorchScript model (*.pt *.pth *.ts)']
+    self.modelPathLineEdit.currentPathChanged.connect(self.onSelectorModified)
+    modelLayout.addRow('TorchScript model: ', self.modelPathLineEdit)
+
+    self.patchSizeWidget = CoordinatesWidget(decimals=0, coordinates=64)
+    modelLayout.addRow('Patch size: ', self.patchSizeWidget.widget)
+
+    self.patchOverlapWidget = CoordinatesWidget(decimals=0, coordinates=8, step=2)
+    modelLayout.addRow('Patch overlap: ', self.patchOverlapWidget.widget)
+
+    self.overlapModeComboBox = qt.QComboBox()
+    self.overlapModeComboBox.addItems(['crop', 'average'])
+    modelLayout.addRow('Overlap mode: ', self.overlapModeComboBox)
+
+    self.batchSizeSpinBox = qt.QSpinBox()
+    self.batchSizeSpinBox.minimum = 1
+    self.batchSizeSpinBox.maximum = 256
+    self.batchSizeSpinBox.value = 4
+    modelLayout.addRow('Batch size: ', self.batchSizeSpinBox)
+
+    self.workersSpinBox = qt.QSpinBox()
+    self.workersSpinBox.minimum = 1
+    self.workersSpinBox.maximum = 32
+    self.workersSpinBox.value = 2
+    self.workersSpinBox.setToolTip('Number of threads used to extract and batch patches')
+    modelLayout.addRow('Loader threads: ', self.workersSpinBox)
+
+    self.sigmoidCheckBox = qt.QCheckBox('Apply sigmoid')
+    self.sigmoidCheckBox.setToolTip(
+      'Convert single-channel logits to probabilities before thresholding')
+    modelLayout.addRow(self.sigmoidCheckBox)
+
+    self.thresholdSpinBox = qt.QDoubleSpinBox()
+    self.thresholdSpinBox.minimum = -1000
+    self.thresholdSpinBox.maximum = 1000
+    self.thresholdSpinBox.singleStep = 0.05
+    self.thresholdSpinBox.value = 0.5
+    self.thresholdSpinBox.setToolTip(
+      'Single-channel outputs above this value are foreground in the label map.'
+      ' Multichannel outputs are labeled with the channel of maximum value')
+    modelLayout.addRow('Threshold: ', self.thresholdSpinBox)
+
+  def addRunButton(self):
+    self.runButton = qt.QPushButton('Run inference')
+    self.runButton.clicked.connect(self.onRunButton)
+    self.runButton.setDisabled(True)
+    self.layout.addWidget(self.runButton)
+
+    self.throughputLabel = qt.QLabel()
+    self.layout.addWidget(self.throughputLabel)
+
+  def onSelectorModified(self):
+    self.runButton.setDisabled(
+      self.inputSelector.currentNode() is None
+      or not Path(self.modelPathLineEdit.currentPath).is_file()
+    )
+
+  def onRunButton(self):
+    inputVolumeNode = self.inputSelector.currentNode()
+    outputVolumeNode = self.outputSelector.currentNode()
+
+    if outputVolumeNode is None:
+      isLabel = self.outputTypeComboBox.currentText == 'Label map'
+      outputVolumeNode = slicer.mrmlScene.AddNewNodeByClass(
+        MRML_LABEL if isLabel else MRML_SCALAR,
+        f'{inputVolumeNode.GetName()} inference',
+      )
+      outputVolumeNode.CreateDefaultDisplayNodes()
+      self.outputSelector.currentNodeID = outputVolumeNode.GetID()
+    try:
+      throughput = self.logic.infer(
+        inputVolumeNode,
+        outputVolumeNode,
+        self.modelPathLineEdit.currentPath,
+        self.patchSizeWidget.getCoordinates(),
+        self.patchOverlapWidget.getCoordinates(),
+        batchSize=self.batchSizeSpinBox.value,
+        numWorkers=self.workersSpinBox.value,
+        overlapMode=self.overlapModeComboBox.currentText,
+        threshold=self.thresholdSpinBox.value,
+        sigmoid=self.sigmoidCheckBox.checked,
+      )
+    except:
+      message = 'Error running inference.'
+      detailedText = f'Error details:\n{traceback.format_exc()}'
+      slicer.util.errorDisplay(message, detailedText=detailedText)
+      return
+    self.throughputLabel.text = f'Throughput: {throughput:.1f} patches/s'
+    if outputVolumeNode.IsA(MRML_LABEL):
+      slicer.util.setSliceViewerLayers(background=inputVolumeNode, label=outputVolumeNode)
+    else:
+      slicer.util.setSliceViewerLayers(background=outputVolumeNode)
+
+
+class TorchIOInferenceLogic(TorchIOModuleLogic):
+  def loadModel(self, path):
+    import torch
+    model = torch.jit.load(str(path), map_location='cpu')
+    model.eval()
+    return model
+
+  def getBatches(self, sampler, batchSize, numWorkers, prefetch=2):
+    """Yield batches of patches and their locations, extracted in worker threads.
+
+    At most ``numWorkers * prefetch`` batches are prepared ahead of the one
+    being consumed, so that patch extraction overlaps with the forward passes.
+    """
+    import torch
+    tio = self.torchio
+    indices = list(range(len(sampler)))
+    chunks = [indices[i:i + batchSize] for i in range(0, len(indices), batchSize)]
+
+    def collate(chunk):
+      patches = [sampler[index] for index in chunk]
+      images = torch.stack([patch['image'][tio.DATA] for patch in patches])
+      locations = torch.stack([torch.as_tensor(patch[tio.LOCATION]) for patch in patches])
+      return images, locations
+
+    with ThreadPoolExecutor(max_workers=numWorkers) as executor:
+      pending = deque()
+      for chunk in chunks:
+        pending.append(executor.submit(collate, chunk))
+        if len(pending) > numWorkers * prefetch:
+          yield pending.popleft().result()
+      while pending:
+        yield pending.popleft().result()
+
+  def infer(
+      self,
+      inputNode,
+      outputNode,
+      modelPath,
+      patchSize,
+      patchOverlap,
+      batchSize=4,
+      numWorkers=2,
+      overlapMode='crop',
+      threshold=0.5,
+      sigmoid=False,
+      ):
+    """Run a TorchScript model on patches of a volume and aggregate its output.
+
+    If the output node is a label map, multichannel outputs are labeled with
+    the channel of maximum value. Single-channel outputs are thresholded at
+    ``threshold``, after a sigmoid if ``sigmoid`` is True, which is needed if
+    the model returns logits rather than probabilities. Returns the number
+    of patches processed per second.
+    """
+    import torch
+    tio = self.torchio
+    model = self.loadModel(modelPath)
+    image = self.getTorchIOImageFromVolumeNode(inputNode)
+    subject = tio.Subject(image=image)
+    sampler = tio.GridSampler(subject, patchSize, patchOverlap)
+    aggregator = tio.GridAggregator(sampler, overlap_mode=overlapMode)
+    numPatches = len(sampler)
+    with self.showWaitCursor(), torch.no_grad():
+      start = time.perf_counter()
+      for images, locations in self.getBatches(sampler, batchSize, numWorkers):
+        aggregator.add_batch(model(images), locations)
+      seconds = time.perf_counter() - start
+    throughput = numPatches / seconds
+    logging.info(
+      f'Inferred {numPatches} patches in {seconds:.2f} s'
+      f' ({throughput:.1f} patches/s)'
+    )
+    output = aggregator.get_output_tensor()
+    if outputNode.IsA(MRML_LABEL):
+      if len(output) > 1:
+        output = output.argmax(dim=0, keepdim=True)
+      else:
+        if sigmoid:
+          output = output.sigmoid()
+        output = output > threshold
+      outputImage = tio.LabelMap(tensor=output.to(torch.int16), affine=image.affine)
+    else:
+      outputImage = tio.ScalarImage(tensor=output.float(), affine=image.affine)
+    self.getVolumeNodeFromTorchIOImage(outputImage, outputNode)
+    return throughput
+
+
+class TorchIOInferenceTest(ScriptedLoadableModuleTest):
+  def setUp(self):
+    """ Do whatever is needed to reset the state - typically a scene clear will be enough.
+    """
+    slicer.mrmlScene.Clear(0)
+    import torch
+    self.modelPath = Path(slicer.util.tempDirectory()) / 'identity.pt'
+    model = torch.nn.Conv3d(1, 1, 1)
+    torch.nn.init.ones_(model.weight)
+    torch.nn.init.zeros_(model.bias)
+    torch.jit.script(model).save(str(self.modelPath))
+
+  def tearDown(self):
+    self.modelPath.unlink()
+
+  def runTest(self):
+    """Run as few or as many tests as needed here.
+    """
+    self.setUp()
+    self.test_TorchIOInference()
+    self.tearDown()
+
+  def _delayDisplay(self, message):
+    if not slicer.app.testingEnabled():
+      self.delayDisplay(message)
+
+  def test_TorchIOInference(self):
+    self._delayDisplay("Starting the test")
+    import SampleData
+    volumeNode = SampleData.downloadSample('MRHead')
+    self._delayDisplay('Finished with download and loading')
+    logic = TorchIOInferenceLogic()
+    outputNode = slicer.mrmlScene.AddNewNodeByClass(MRML_SCALAR)
+    throughput = logic.infer(
+      volumeNode,
+      outputNode,
+      self.modelPath,
+      patchSize=(32, 32, 32),
+      patchOverlap=(4, 4, 4),
+      batchSize=2,
+    )
+    self.assertGreater(throughput, 0)
+    inputArray = slicer.util.arrayFromVolume(volumeNode)
+    outputArray = slicer.util.arrayFromVolume(outputNode)
+    self.assertEqual(inputArray.shape, outputArray.shape)
+    # The identity model returns the intensities, which are thresholded
+    labelNode = slicer.mrmlScene.AddNewNodeByClass(MRML_LABEL)
+    threshold = float(inputArray.mean())
+    logic.infer(
+      volumeNode,
+      labelNode,
+      self.modelPath,
+      patchSize=(32, 32, 32),
+      patchOverlap=(4, 4, 4),
+      threshold=threshold,
+    )
+    labelArray = slicer.util.arrayFromVolume(labelNode)
+    self.assertTrue(np.array_equal(labelArray > 0, inputArray > threshold))
+    self._delayDisplay('Test passed!')
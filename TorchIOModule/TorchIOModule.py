@@ -1,14 +1,19 @@
+import json
 import logging
+import importlib
+from pathlib import Path
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import SimpleITK as sitk
 
-import qt, slicer
+import qt, vtk, slicer
 import sitkUtils as su
 from slicer.ScriptedLoadableModule import (
   ScriptedLoadableModule,
   ScriptedLoadableModuleLogic,
+  ScriptedLoadableModuleTest,
 )
 
 import PyTorchUtils
@@ -16,6 +21,8 @@ import PyTorchUtils
 
 MRML_LABEL = 'vtkMRMLLabelMapVolumeNode'
 MRML_SCALAR = 'vtkMRMLScalarVolumeNode'
+# Increase to invalidate the datasets cached by previous versions
+DATASET_CACHE_VERSION = 1
 
 
 class TorchIOModule(ScriptedLoadableModule):
@@ -93,6 +100,21 @@ class TorchIOModuleLogic(ScriptedLoadableModuleLogic):
     logging.info(f'TorchIO {torchio.__version__} installed correctly')
     return torchio
 
+  @staticmethod
+  def importOrInstall(moduleName, confirm=True):
+    try:
+      return importlib.import_module(moduleName)
+    except ModuleNotFoundError:
+      pass
+    if confirm and not slicer.app.commandOptions().testingEnabled:
+      install = slicer.util.confirmOkCancelDisplay(
+        f'{moduleName} will be downloaded and installed now.'
+      )
+      if not install:
+        raise ModuleNotFoundError(f'Installation of {moduleName} aborted by user')
+    slicer.util.pip_install(moduleName)
+    return importlib.import_module(moduleName)
+
   def getTorchIOImageFromVolumeNode(self, volumeNode):
     image = su.PullVolumeFromSlicer(volumeNode)
     tio = self.torchio
@@ -104,16 +126,29 @@ class TorchIOModuleLogic(ScriptedLoadableModuleLogic):
     tensor, affine = tio.io.sitk_to_nib(image)
     return class_(tensor=tensor, affine=affine)
 
-  def getVolumeNodeFromTorchIOImage(self, image, outputVolumeNode=None):
+  def getVolumeNodeFromTorchIOImage(self, image, outputVolumeNode=None, name=None):
     tio = self.torchio
     kwargs = {}
     if outputVolumeNode is None:
-      kwargs = {'className': MRML_LABEL if isinstance(image, tio.LabelMap) else MRML_SCALAR}
+      kwargs = {
+        'className': MRML_LABEL if isinstance(image, tio.LabelMap) else MRML_SCALAR,
+        'name': name,
+      }
     else:
       kwargs = {'targetNode': outputVolumeNode}
-    su.PushVolumeToSlicer(image.as_sitk(), **kwargs)
+    outputVolumeNode = su.PushVolumeToSlicer(image.as_sitk(), **kwargs)
     return outputVolumeNode
 
+  def getIJKToRASArray(self, volumeNode):
+    matrix = vtk.vtkMatrix4x4()
+    volumeNode.GetIJKToRASMatrix(matrix)
+    return slicer.util.arrayFromVTKMatrix(matrix)
+
+  def updateVolumeFromArray(self, volumeNode, array, ijkToRAS):
+    """Import a KJI array directly, without going through SimpleITK."""
+    slicer.util.updateVolumeFromArray(volumeNode, array)
+    volumeNode.SetIJKToRASMatrix(slicer.util.vtkMatrixFromArray(ijkToRAS))
+
   def getPythonConsoleWidget(self):
     return slicer.util.mainWindow().pythonConsole().parent()
 
@@ -133,9 +168,11 @@ class TorchIOModuleLogic(ScriptedLoadableModuleLogic):
   def showWaitCursor(self, show=True):
     if show:
       qt.QApplication.setOverrideCursor(qt.Qt.WaitCursor)
-    yield
-    if show:
-      qt.QApplication.restoreOverrideCursor()
+    try:
+      yield
+    finally:
+      if show:
+        qt.QApplication.restoreOverrideCursor()
 
   def getNodesFromSubject(self, subject):
     nodes = {}
@@ -143,9 +180,81 @@ class TorchIOModuleLogic(ScriptedLoadableModuleLogic):
       nodes[name] = self.getVolumeNodeFromTorchIOImage(image, name=name)
     return nodes
 
+  def getDatasetCacheDir(self, datasetName, root=None, **kwargs):
+    if root is None:
+      root = Path(slicer.app.cachePath) / 'TorchIO'
+    dirName = datasetName + ''.join(f'_{key}-{value}' for key, value in sorted(kwargs.items()))
+    return Path(root) / f'v{DATASET_CACHE_VERSION}' / dirName
+
+  def cacheDataset(self, datasetName, cacheDir, **kwargs):
+    """Download a TorchIO dataset and store its images as uncompressed arrays.
+
+    The keyword arguments are passed to the dataset class. Arrays are saved in
+    KJI order with their IJK to RAS matrix, so that they can be imported into
+    Slicer directly. Each channel of a multichannel image is saved separately,
+    with the channel index appended to the image name.
+    """
+    klass = getattr(self.torchio.datasets, datasetName)
+    subject = klass(**kwargs)
+    images = subject.get_images_dict(intensity_only=False)
+
+    def save(item):
+      name, image = item
+      imageType = 'label' if isinstance(image, self.torchio.LabelMap) else 'scalar'
+      data = image.data.numpy()
+      index = {}
+      for channel, channelData in enumerate(data):
+        nodeName = name if len(data) == 1 else f'{name}_{channel}'
+        array = np.ascontiguousarray(channelData.transpose(2, 1, 0))
+        np.save(cacheDir / f'{nodeName}.npy', array)
+        np.save(cacheDir / f'{nodeName}_ijk_to_ras.npy', image.affine)
+        index[nodeName] = imageType
+      return index
+
+    cacheDir.mkdir(parents=True, exist_ok=True)
+    index = {}
+    with ThreadPoolExecutor() as executor:
+      for imageIndex in executor.map(save, images.items()):
+        index.update(imageIndex)
+    # The index is written last, so an interrupted download is not used
+    with open(cacheDir / 'index.json', 'w') as f:
+      json.dump(index, f)
+    logging.info(f'{datasetName} cached in {cacheDir}')
+
+  def loadDataset(self, datasetName, root=None, **kwargs):
+    """Load the images of a TorchIO dataset into new volume nodes.
+
+    The keyword arguments are passed to the dataset class, for example the
+    version of Colin27. The dataset is downloaded and cached the first time.
+    Later loads read the cached arrays in parallel and import them without
+    SimpleITK, so they work offline.
+    """
+    cacheDir = self.getDatasetCacheDir(datasetName, root=root, **kwargs)
+    indexPath = cacheDir / 'index.json'
+    if not indexPath.is_file():
+      with self.showWaitCursor():
+        self.cacheDataset(datasetName, cacheDir, **kwargs)
+    with open(indexPath) as f:
+      index = json.load(f)
+
+    def load(name):
+      array = np.load(cacheDir / f'{name}.npy')
+      ijkToRAS = np.load(cacheDir / f'{name}_ijk_to_ras.npy')
+      return name, array, ijkToRAS
+
+    with ThreadPoolExecutor() as executor:
+      loaded = list(executor.map(load, index))
+    nodes = {}
+    for name, array, ijkToRAS in loaded:
+      className = MRML_LABEL if index[name] == 'label' else MRML_SCALAR
+      node = slicer.mrmlScene.AddNewNodeByClass(className, name)
+      self.updateVolumeFromArray(node, array, ijkToRAS)
+      node.CreateDefaultDisplayNodes()
+      nodes[name] = node
+    return nodes
+
   def getColin(self, version=1998):
-    colin = self.torchio.datasets.Colin27(version=version)
-    nodes = self.getNodesFromSubject(colin)
+    nodes = self.loadDataset('Colin27', version=version)
     if version == 1998:
       slicer.util.setSliceViewerLayers(
         background=nodes['t1'],
@@ -157,3 +266,39 @@ class TorchIOModuleLogic(ScriptedLoadableModuleLogic):
         foreground=nodes['t2'],
         label=nodes['cls'],
       )
+
+
+class TorchIOModuleTest(ScriptedLoadableModuleTest):
+  def setUp(self):
+    slicer.mrmlScene.Clear(0)
+
+  def runTest(self):
+    self.setUp()
+    self.test_DatasetCache()
+
+  def test_DatasetCache(self):
+    logic = TorchIOModuleLogic()
+    root = Path(slicer.util.tempDirectory())
+    cacheDir = logic.getDatasetCacheDir('Colin27', root=root, version=1998)
+    cacheDir.mkdir(parents=True)
+    ijkToRAS = np.diag((-1, -1, 1, 1)).astype(float)
+    arrays = {
+      't1': np.random.rand(10, 12, 14).astype(np.float32),
+      'brain': np.random.randint(0, 2, (10, 12, 14)).astype(np.uint8),
+    }
+    for name, array in arrays.items():
+      np.save(cacheDir / f'{name}.npy', array)
+      np.save(cacheDir / f'{name}_ijk_to_ras.npy', ijkToRAS)
+    with open(cacheDir / 'index.json', 'w') as f:
+      json.dump({'t1': 'scalar', 'brain': 'label'}, f)
+
+    def download(*args, **kwargs):
+      self.fail('The cached dataset should be loaded without downloading it')
+    logic.cacheDataset = download
+
+    nodes = logic.loadDataset('Colin27', root=root, version=1998)
+    self.assertEqual(set(nodes), set(arrays))
+    self.assertTrue(nodes['brain'].IsA(MRML_LABEL))
+    for name, array in arrays.items():
+      self.assertTrue(np.array_equal(slicer.util.arrayFromVolume(nodes[name]), array))
+      self.assertTrue(np.allclose(logic.getIJKToRASArray(nodes[name]), ijkToRAS))
@@ -1,7 +1,11 @@
+import time
+import fnmatch
 import logging
 import traceback
 from pathlib import Path
+from collections import deque
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 
@@ -15,10 +19,22 @@ from slicer.ScriptedLoadableModule import (
 )
 
 import TorchIOTransformsLib
+from TorchIOTransformsLib.Export import FORMATS, AsyncWriter, NiftiWriter, Hdf5Writer, ZarrWriter
+from TorchIOTransformsLib.History import TransformHistory
+from TorchIOTransformsLib.Memory import formatBytes
+from TorchIOTransformsLib.Statistics import getSparkline
 from TorchIOModule import TorchIOModuleLogic
 
 
 TRANSFORMS = list(sorted(transformName for transformName in TorchIOTransformsLib.__all__))
+# Class of the volumes and subclass to leave out, as label maps are scalar volumes
+VOLUME_CLASSES = {
+  'All volumes': ('vtkMRMLVolumeNode', None),
+  'Scalar volumes': ('vtkMRMLScalarVolumeNode', 'vtkMRMLLabelMapVolumeNode'),
+  'Label maps': ('vtkMRMLLabelMapVolumeNode', None),
+}
+# Set on the volumes created by this module, with the name of the transform
+OUTPUT_ATTRIBUTE = 'TorchIO.Transform'
 
 
 class TorchIOTransforms(ScriptedLoadableModule):
@@ -62,16 +78,32 @@ class TorchIOTransformsWidget(ScriptedLoadableModuleWidget):
       return
     self.transforms = []
     self.currentTransform = None
+    self.history = TransformHistory()
     self.makeGUI()
     self.onVolumeSelectorModified()
     slicer.torchio = self
     self.backgroundNode = None
+    self.sceneCloseObserverTag = slicer.mrmlScene.AddObserver(
+      slicer.mrmlScene.EndCloseEvent, self.onSceneEndClose)
+
+  def cleanup(self):
+    if hasattr(self, 'sceneCloseObserverTag'):
+      slicer.mrmlScene.RemoveObserver(self.sceneCloseObserverTag)
+
+  def onSceneEndClose(self, caller, event):
+    self.history.clear()
+    self.updateHistorySlider()
 
   def makeGUI(self):
     self.addNodesButton()
     self.addTransformButton()
     self.addTransforms()
     self.addToggleApplyButtons()
+    self.addStatisticsButton()
+    self.addHistoryButton()
+    self.addSweepButton()
+    self.addSceneButton()
+    self.addExportButton()
     # Add vertical spacer
     self.layout.addStretch(1)
 
@@ -86,7 +118,7 @@ class TorchIOTransformsWidget(ScriptedLoadableModuleWidget):
     nodesLayout.addWidget(goToSampleDataButton)
 
     self.inputSelector = slicer.qMRMLNodeComboBox()
-    self.inputSelector.nodeTypes = ['vtkMRMLVolumeNode']
+    self.inputSelector.nodeTypes = ['vtkMRMLVolumeNode', 'vtkMRMLSequenceNode']
     self.inputSelector.addEnabled = False
     self.inputSelector.removeEnabled = True
     self.inputSelector.noneEnabled = False
@@ -95,7 +127,7 @@ class TorchIOTransformsWidget(ScriptedLoadableModuleWidget):
     nodesLayout.addRow('Input volume: ', self.inputSelector)
 
     self.outputSelector = slicer.qMRMLNodeComboBox()
-    self.outputSelector.nodeTypes = ['vtkMRMLScalarVolumeNode']
+    self.outputSelector.nodeTypes = ['vtkMRMLScalarVolumeNode', 'vtkMRMLSequenceNode']
     self.outputSelector.selectNodeUponCreation = False
     self.outputSelector.addEnabled = False
     self.outputSelector.removeEnabled = True
@@ -105,6 +137,25 @@ class TorchIOTransformsWidget(ScriptedLoadableModuleWidget):
     self.outputSelector.currentNodeChanged.connect(self.onVolumeSelectorModified)
     nodesLayout.addRow('Output volume: ', self.outputSelector)
 
+    self.framesPerBatchSpinBox = qt.QSpinBox()
+    self.framesPerBatchSpinBox.minimum = 1
+    self.framesPerBatchSpinBox.maximum = 32
+    self.framesPerBatchSpinBox.value = 1
+    self.framesPerBatchSpinBox.setToolTip(
+      'Number of sequence frames transformed together as channels of one image')
+    nodesLayout.addRow('Frames per batch: ', self.framesPerBatchSpinBox)
+
+    self.memoryBudgetSpinBox = qt.QSpinBox()
+    self.memoryBudgetSpinBox.maximum = 1024 * 1024
+    self.memoryBudgetSpinBox.singleStep = 256
+    self.memoryBudgetSpinBox.suffix = ' MB'
+    self.memoryBudgetSpinBox.specialValueText = 'Available memory'
+    self.memoryBudgetSpinBox.setToolTip(
+      'Maximum memory used to apply a transform. Larger inputs are processed'
+      ' in lower precision, by region or in slabs when possible')
+    self.memoryBudgetSpinBox.valueChanged.connect(self.onMemoryBudgetChanged)
+    nodesLayout.addRow('Memory budget: ', self.memoryBudgetSpinBox)
+
   def addTransformButton(self):
     self.transformsButton = ctk.ctkCollapsibleButton()
     self.transformsButton.text = 'Transforms'
@@ -140,6 +191,142 @@ class TorchIOTransformsWidget(ScriptedLoadableModuleWidget):
 
     self.layout.addWidget(toggleApplyFrame)
 
+  def addStatisticsButton(self):
+    self.statisticsButton = ctk.ctkCollapsibleButton()
+    self.statisticsButton.text = 'Statistics'
+    self.statisticsButton.collapsed = True
+    self.layout.addWidget(self.statisticsButton)
+    statisticsLayout = qt.QFormLayout(self.statisticsButton)
+
+    self.statisticsCheckBox = qt.QCheckBox('Compute statistics when applying')
+    self.statisticsCheckBox.setToolTip(
+      'Statistics are computed from a random sample of the voxels')
+    statisticsLayout.addRow(self.statisticsCheckBox)
+
+    self.differenceComboBox = qt.QComboBox()
+    self.differenceComboBox.addItems(['None', 'Difference', 'Absolute difference'])
+    statisticsLayout.addRow('Difference volume: ', self.differenceComboBox)
+
+    self.differenceLabel = qt.QLabel()
+    self.differenceLabel.wordWrap = True
+    statisticsLayout.addRow(self.differenceLabel)
+
+    self.statisticsTable = qt.QTableWidget()
+    self.statisticsTable.setColumnCount(2)
+    self.statisticsTable.setHorizontalHeaderLabels(['Input', 'Output'])
+    self.statisticsTable.horizontalHeader().setSectionResizeMode(qt.QHeaderView.Stretch)
+    self.statisticsTable.setEditTriggers(qt.QAbstractItemView.NoEditTriggers)
+    statisticsLayout.addRow(self.statisticsTable)
+
+    font = qt.QFont('Monospace')
+    font.setStyleHint(qt.QFont.TypeWriter)
+    self.inputHistogramLabel = qt.QLabel()
+    self.inputHistogramLabel.setFont(font)
+    statisticsLayout.addRow('Input histogram: ', self.inputHistogramLabel)
+    self.outputHistogramLabel = qt.QLabel()
+    self.outputHistogramLabel.setFont(font)
+    statisticsLayout.addRow('Output histogram: ', self.outputHistogramLabel)
+
+  def addHistoryButton(self):
+    self.historyButton = ctk.ctkCollapsibleButton()
+    self.historyButton.text = 'History'
+    self.historyButton.collapsed = True
+    self.layout.addWidget(self.historyButton)
+    historyLayout = qt.QFormLayout(self.historyButton)
+
+    self.historySizeSpinBox = qt.QSpinBox()
+    self.historySizeSpinBox.minimum = 1
+    self.historySizeSpinBox.maximum = 100
+    self.historySizeSpinBox.value = self.history.maxEntries
+    self.historySizeSpinBox.valueChanged.connect(self.onHistorySizeChanged)
+    historyLayout.addRow('Outputs kept: ', self.historySizeSpinBox)
+
+    self.historySlider = qt.QSlider(qt.Qt.Horizontal)
+    self.historySlider.setDisabled(True)
+    self.historySlider.valueChanged.connect(self.onHistorySliderChanged)
+    historyLayout.addRow('Output: ', self.historySlider)
+
+    self.historyLabel = qt.QLabel()
+    self.historyLabel.wordWrap = True
+    historyLayout.addRow(self.historyLabel)
+
+  def addSweepButton(self):
+    self.sweepButton = ctk.ctkCollapsibleButton()
+    self.sweepButton.text = 'Parameter sweep'
+    self.sweepButton.collapsed = True
+    self.layout.addWidget(self.sweepButton)
+    sweepLayout = qt.QFormLayout(self.sweepButton)
+
+    self.sweepKwargComboBox = qt.QComboBox()
+    sweepLayout.addRow('Parameter: ', self.sweepKwargComboBox)
+
+    self.sweepValuesSpinBox = qt.QSpinBox()
+    self.sweepValuesSpinBox.minimum = 2
+    self.sweepValuesSpinBox.maximum = 25
+    self.sweepValuesSpinBox.value = 5
+    self.sweepValuesSpinBox.setToolTip(
+      'Number of values, evenly spaced within the current parameter range')
+    sweepLayout.addRow('Values: ', self.sweepValuesSpinBox)
+
+    self.sweepOutputComboBox = qt.QComboBox()
+    self.sweepOutputComboBox.addItems(['Montage', 'Sequence'])
+    sweepLayout.addRow('Output: ', self.sweepOutputComboBox)
+
+    self.sweepApplyButton = qt.QPushButton('Sweep parameter')
+    self.sweepApplyButton.clicked.connect(self.onSweepButton)
+    self.sweepApplyButton.setDisabled(True)
+    sweepLayout.addWidget(self.sweepApplyButton)
+
+  def addSceneButton(self):
+    self.sceneButton = ctk.ctkCollapsibleButton()
+    self.sceneButton.text = 'All volumes in scene'
+    self.sceneButton.collapsed = True
+    self.layout.addWidget(self.sceneButton)
+    sceneLayout = qt.QFormLayout(self.sceneButton)
+
+    self.sceneNameLineEdit = qt.QLineEdit('*')
+    self.sceneNameLineEdit.setToolTip('Wildcard pattern matched against the volume names')
+    sceneLayout.addRow('Name filter: ', self.sceneNameLineEdit)
+
+    self.sceneClassComboBox = qt.QComboBox()
+    self.sceneClassComboBox.addItems(list(VOLUME_CLASSES))
+    sceneLayout.addRow('Volume type: ', self.sceneClassComboBox)
+
+    self.sceneApplyButton = qt.QPushButton('Apply to all volumes')
+    self.sceneApplyButton.clicked.connect(self.onSceneButton)
+    sceneLayout.addWidget(self.sceneApplyButton)
+
+    self.sceneTimeLabel = qt.QLabel()
+    sceneLayout.addWidget(self.sceneTimeLabel)
+
+  def addExportButton(self):
+    self.exportButton = ctk.ctkCollapsibleButton()
+    self.exportButton.text = 'Export augmented dataset'
+    self.exportButton.collapsed = True
+    self.layout.addWidget(self.exportButton)
+    exportLayout = qt.QFormLayout(self.exportButton)
+
+    self.exportDirLineEdit = ctk.ctkPathLineEdit()
+    self.exportDirLineEdit.filters = ctk.ctkPathLineEdit.Dirs
+    exportLayout.addRow('Output directory: ', self.exportDirLineEdit)
+
+    self.exportCopiesSpinBox = qt.QSpinBox()
+    self.exportCopiesSpinBox.minimum = 1
+    self.exportCopiesSpinBox.maximum = 10000
+    self.exportCopiesSpinBox.value = 10
+    exportLayout.addRow('Augmented copies: ', self.exportCopiesSpinBox)
+
+    self.exportFormatComboBox = qt.QComboBox()
+    self.exportFormatComboBox.addItems(FORMATS)
+    exportLayout.addRow('Format: ', self.exportFormatComboBox)
+
+    self.exportApplyButton = qt.QPushButton('Export')
+    self.exportApplyButton.clicked.connect(self.onExportButton)
+    exportLayout.addWidget(self.exportApplyButton)
+
+    self.exportSpeedLabel = qt.QLabel()
+    exportLayout.addWidget(self.exportSpeedLabel)
+
   def onTransformsComboBox(self):
     transformName = self.transformsComboBox.currentText
     for transform in self.transforms:
@@ -148,16 +335,39 @@ class TorchIOTransformsWidget(ScriptedLoadableModuleWidget):
         transform.show()
       else:
         transform.hide()
+    self.sweepKwargComboBox.clear()
+    self.sweepKwargComboBox.addItems(self.currentTransform.getSweepableKwargs())
     self.onVolumeSelectorModified()
 
+  def onMemoryBudgetChanged(self, value):
+    budget = None if value == 0 else value * 1024 ** 2
+    for transform in self.transforms:
+      transform.memoryBudget = budget
+
   def onVolumeSelectorModified(self):
+    inputNode = self.inputSelector.currentNode()
+    outputNode = self.outputSelector.currentNode()
+    isSequence = inputNode is not None and inputNode.IsA('vtkMRMLSequenceNode')
+    isOutputSequence = outputNode is not None and outputNode.IsA('vtkMRMLSequenceNode')
+    typesMatch = outputNode is None or isSequence == isOutputSequence
     self.applyButton.setDisabled(
-      self.inputSelector.currentNode() is None
+      inputNode is None
       or self.currentTransform is None
+      or not typesMatch
     )
+    self.applyButton.toolTip = '' if typesMatch else (
+      'Input and output must both be sequences or both be volumes')
     self.toggleButton.setEnabled(
-      self.inputSelector.currentNode() is not None
-      and self.outputSelector.currentNode() is not None
+      inputNode is not None
+      and outputNode is not None
+      and not isSequence
+      and not outputNode.IsA('vtkMRMLSequenceNode')
+    )
+    self.sweepApplyButton.setDisabled(
+      inputNode is None
+      or isSequence
+      or self.currentTransform is None
+      or not self.currentTransform.getSweepableKwargs()
     )
 
   def onToggleButton(self):
@@ -178,17 +388,22 @@ class TorchIOTransformsWidget(ScriptedLoadableModuleWidget):
     outputVolumeNode = self.outputSelector.currentNode()
 
     if outputVolumeNode is None:
-      name = f'{inputVolumeNode.GetName()} {self.currentTransform.name}'
-      outputVolumeNode = slicer.mrmlScene.AddNewNodeByClass(
-        inputVolumeNode.GetClassName(),
-        name,
-      )
-      outputVolumeNode.CreateDefaultDisplayNodes()
+      outputVolumeNode = self.logic.createOutputNode(inputVolumeNode, self.currentTransform.name)
       self.outputSelector.currentNodeID = outputVolumeNode.GetID()
     try:
       kwargs = self.currentTransform.getKwargs()
       logging.info(f'Transform args: {kwargs}')
-      self.currentTransform(inputVolumeNode, outputVolumeNode)
+      self.currentTransform(
+        inputVolumeNode,
+        outputVolumeNode,
+        framesPerBatch=self.framesPerBatchSpinBox.value,
+        statistics=self.statisticsCheckBox.checked,
+        difference=self.differenceComboBox.currentText != 'None',
+        absoluteDifference=self.differenceComboBox.currentText == 'Absolute difference',
+      )
+    except MemoryError as error:
+      slicer.util.errorDisplay(str(error))
+      return
     except:
       message = 'Error applying the transform.'
       detailedText = (
@@ -197,6 +412,195 @@ class TorchIOTransformsWidget(ScriptedLoadableModuleWidget):
       )
       slicer.util.errorDisplay(message, detailedText=detailedText)
       return
+    if outputVolumeNode.IsA('vtkMRMLSequenceNode'):
+      inputVolumeNode = self.logic.getSequenceProxyNode(inputVolumeNode)
+      outputVolumeNode = self.logic.getSequenceProxyNode(outputVolumeNode)
+    else:
+      self.addToHistory(inputVolumeNode, outputVolumeNode)
+    self.updateStatistics(self.currentTransform.lastStatistics)
+    self.updateDifference(outputVolumeNode)
+    self.showOutput(inputVolumeNode, outputVolumeNode)
+
+  def updateDifference(self, outputVolumeNode):
+    transform = self.currentTransform
+    self.differenceLabel.text = transform.lastDifferenceError or ''
+    if transform.lastDifference is None:
+      return
+    differenceVolumeNode = self.getDifferenceVolumeNode(outputVolumeNode)
+    transform.setVolumeNodeFromImage(transform.lastDifference, differenceVolumeNode)
+    transform.lastDifference = None  # do not keep a copy of the volume in memory
+
+  def getDifferenceVolumeNode(self, outputVolumeNode):
+    name = f'{outputVolumeNode.GetName()} {self.differenceComboBox.currentText.lower()}'
+    differenceVolumeNode = slicer.mrmlScene.GetFirstNodeByName(name)
+    if differenceVolumeNode is None:
+      differenceVolumeNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLScalarVolumeNode', name)
+      differenceVolumeNode.SetAttribute(OUTPUT_ATTRIBUTE, self.currentTransform.name)
+      differenceVolumeNode.CreateDefaultDisplayNodes()
+    return differenceVolumeNode
+
+  def updateStatistics(self, statistics):
+    if statistics is None:
+      self.statisticsTable.setRowCount(0)
+      self.inputHistogramLabel.text = ''
+      self.outputHistogramLabel.text = ''
+      return
+    names = [name for name in statistics['input'] if name != 'histogram']
+    self.statisticsTable.setRowCount(len(names))
+    self.statisticsTable.setVerticalHeaderLabels(names)
+    for row, name in enumerate(names):
+      for column, key in enumerate(('input', 'output')):
+        item = qt.QTableWidgetItem(f'{statistics[key][name]:.4g}')
+        self.statisticsTable.setItem(row, column, item)
+    low, high = statistics['range']
+    rangeText = f'Range: [{low:.4g}, {high:.4g}] (logarithmic counts)'
+    for key, label in (('input', self.inputHistogramLabel), ('output', self.outputHistogramLabel)):
+      label.text = getSparkline(statistics[key]['histogram'])
+      label.toolTip = rangeText
+
+  def addToHistory(self, inputVolumeNode, outputVolumeNode):
+    transform = self.currentTransform
+    deterministicTransform = transform.lastAppliedTransform
+    replay = None
+    # Other strategies transform a crop or slabs, so replaying would differ
+    canReplay = transform.lastStrategy in ('full', 'reduced')
+    if canReplay and inputVolumeNode is not outputVolumeNode and deterministicTransform is not None:
+      replay = lambda: transform.replay(inputVolumeNode, outputVolumeNode, deterministicTransform)
+    entry = self.history.add(
+      str(deterministicTransform or transform.name),
+      outputVolumeNode.GetID(),
+      slicer.util.arrayFromVolume(outputVolumeNode),
+      self.logic.getIJKToRASArray(outputVolumeNode),
+      replay=replay,
+      inputNodeID=inputVolumeNode.GetID(),
+    )
+    self.updateHistorySlider()
+    if entry is None:
+      self.historyLabel.text += ' The last output is too large to be kept.'
+
+  def updateHistorySlider(self):
+    numEntries = len(self.history)
+    self.historySlider.blockSignals(True)
+    self.historySlider.maximum = max(0, numEntries - 1)
+    self.historySlider.value = self.historySlider.maximum
+    self.historySlider.blockSignals(False)
+    self.historySlider.setEnabled(numEntries > 1)
+    self.updateHistoryLabel()
+
+  def updateHistoryLabel(self):
+    if not len(self.history):
+      self.historyLabel.text = ''
+      return
+    entry = self.history[self.historySlider.value]
+    self.historyLabel.text = (
+      f'{self.historySlider.value + 1}/{len(self.history)}'
+      f' ({formatBytes(self.history.numBytes)} in memory)'
+    )
+    self.historyLabel.toolTip = entry.description
+
+  def onHistorySizeChanged(self, value):
+    self.history.maxEntries = value
+    self.history.trim()
+    self.updateHistorySlider()
+
+  def removeStaleHistoryEntries(self):
+    """Remove the entries whose input or output node is no longer in the scene."""
+    stale = [
+      entry for entry in self.history
+      if slicer.mrmlScene.GetNodeByID(entry.outputNodeID) is None
+      or slicer.mrmlScene.GetNodeByID(entry.inputNodeID) is None
+    ]
+    for entry in stale:
+      self.history.remove(entry)
+    return bool(stale)
+
+  def onHistorySliderChanged(self, index):
+    if self.removeStaleHistoryEntries():
+      self.updateHistorySlider()
+      return
+    entry = self.history[index]
+    outputVolumeNode = slicer.mrmlScene.GetNodeByID(entry.outputNodeID)
+    try:
+      if entry.compressed is None:
+        with self.logic.showWaitCursor():
+          entry.replay()
+      else:
+        self.logic.updateVolumeFromArray(outputVolumeNode, entry.getArray(), entry.ijkToRAS)
+    except:
+      message = 'Error restoring the output from the history.'
+      detailedText = f'Error details:\n{traceback.format_exc()}'
+      slicer.util.errorDisplay(message, detailedText=detailedText)
+      return
+    self.updateHistoryLabel()
+
+  def onSweepButton(self):
+    inputVolumeNode = self.inputSelector.currentNode()
+    kwarg = self.sweepKwargComboBox.currentText
+    try:
+      outputVolumeNode = self.logic.sweepTransform(
+        self.currentTransform,
+        inputVolumeNode,
+        kwarg,
+        self.sweepValuesSpinBox.value,
+        montage=self.sweepOutputComboBox.currentText == 'Montage',
+      )
+    except:
+      message = 'Error sweeping the transform parameter.'
+      detailedText = f'Error details:\n{traceback.format_exc()}'
+      slicer.util.errorDisplay(message, detailedText=detailedText)
+      return
+    self.showOutput(inputVolumeNode, outputVolumeNode)
+
+  def onSceneButton(self):
+    if self.currentTransform is None:
+      slicer.util.errorDisplay('Select a transform first.')
+      return
+    className, excludedClassName = VOLUME_CLASSES[self.sceneClassComboBox.currentText]
+    inputNodes = self.logic.getVolumeNodes(
+      self.sceneNameLineEdit.text,
+      className,
+      excludedClassName,
+    )
+    if not inputNodes:
+      slicer.util.errorDisplay('No volumes match the filter.')
+      return
+    try:
+      _, wallSeconds, workerSeconds = self.logic.applyTransformToNodes(
+        self.currentTransform,
+        inputNodes,
+      )
+    except:
+      message = 'Error applying the transform to the scene volumes.'
+      detailedText = f'Error details:\n{traceback.format_exc()}'
+      slicer.util.errorDisplay(message, detailedText=detailedText)
+      return
+    self.sceneTimeLabel.text = (
+      f'{len(inputNodes)} volumes in {wallSeconds:.1f} s'
+      f' (summed worker time: {workerSeconds:.1f} s)'
+    )
+
+  def onExportButton(self):
+    inputVolumeNode = self.inputSelector.currentNode()
+    outputDir = self.exportDirLineEdit.currentPath
+    if inputVolumeNode is None or self.currentTransform is None or not outputDir:
+      slicer.util.errorDisplay('Select an input volume, a transform and an output directory.')
+      return
+    try:
+      megabytesPerSecond = self.logic.exportAugmentedDataset(
+        self.currentTransform,
+        inputVolumeNode,
+        outputDir,
+        self.exportCopiesSpinBox.value,
+        fileFormat=self.exportFormatComboBox.currentText,
+      )
+    except:
+      message = 'Error exporting the augmented dataset.'
+      detailedText = f'Error details:\n{traceback.format_exc()}'
+      slicer.util.errorDisplay(message, detailedText=detailedText)
+      return
+    self.exportSpeedLabel.text = f'Written at {megabytesPerSecond:.1f} MB/s'
+
+  def showOutput(self, inputVolumeNode, outputVolumeNode):
     inputDisplayNode = inputVolumeNode.GetDisplayNode()
     inputColorNodeID = inputDisplayNode.GetColorNodeID()
     outputDisplayNode = outputVolumeNode.GetDisplayNode()
@@ -215,12 +619,207 @@ class TorchIOTransformsLogic(TorchIOModuleLogic):
     import TorchIOTransformsLib
     return getattr(TorchIOTransformsLib, transformName)()
 
+  def createOutputNode(self, inputNode, transformName):
+    """Create a node of the same class as the input to store the output of a transform."""
+    outputNode = slicer.mrmlScene.AddNewNodeByClass(
+      inputNode.GetClassName(),
+      f'{inputNode.GetName()} {transformName}',
+    )
+    outputNode.SetAttribute(OUTPUT_ATTRIBUTE, transformName)
+    # Sequences are not displayable; their proxy nodes are displayed instead
+    if not outputNode.IsA('vtkMRMLSequenceNode'):
+      outputNode.CreateDefaultDisplayNodes()
+    return outputNode
+
   def applyTransform(self, inputNode, outputNode, transformName):
     if outputNode is None:
-      outputNode = slicer.mrmlScene.AddNewNodeByClass(inputNode.GetClassName())
+      outputNode = self.createOutputNode(inputNode, transformName)
     transform = self.getTransform(transformName)
     with self.showWaitCursor():
       transform(inputNode, outputNode)
+    return outputNode
+
+  def getVolumeNodes(self, namePattern='*', className='vtkMRMLVolumeNode', excludedClassName=None):
+    """Return the visible volumes whose name matches a pattern.
+
+    Outputs of this module are left out, so that they are not transformed again.
+    """
+    nodes = slicer.util.getNodesByClass(className)
+    return [
+      node for node in nodes
+      if not node.GetHideFromEditors()
+      and node.GetAttribute(OUTPUT_ATTRIBUTE) is None
+      and (excludedClassName is None or not node.IsA(excludedClassName))
+      and fnmatch.fnmatch(node.GetName().lower(), namePattern.lower())
+    ]
+
+  def applyTransformToNodes(self, transform, inputNodes, numWorkers=None):
+    """Apply a transform to several volumes concurrently.
+
+    Each volume is transformed as it would be on its own: label maps through
+    the label map path and other volumes with the strategy chosen for the
+    memory limit. Volumes are converted and results are pushed to new nodes in
+    the main thread, as MRML is not thread-safe; only the transforms run in the
+    pool. At most ``numWorkers`` volumes are converted ahead, and results are
+    pushed in order as soon as they are ready. Returns the output nodes, the
+    wall time and the sum of the time spent by the workers, which run
+    concurrently and may therefore be slower than in a serial run.
+    """
+    if numWorkers is None:
+      numWorkers = min(transform.getMaxWorkers(node) for node in inputNodes)
+    torchioTransform = transform.getTransform()
+
+    def timed(function, *args):
+      start = time.perf_counter()
+      result = function(*args)
+      return result, time.perf_counter() - start
+
+    def submit(executor, inputNode):
+      if inputNode.IsA('vtkMRMLLabelMapVolumeNode'):
+        crop = transform.getLabelCrop(inputNode)
+        if crop is None:
+          return None
+        labelTransform = transform.getLabelTransform()
+        return executor.submit(timed, transform.transformLabelCrop, crop, labelTransform)
+      plan = transform.chooseStrategy(inputNode)
+      subject = transform.getSubjectFromVolumeNode(inputNode)
+      return executor.submit(timed, transform.getTransformedImage, subject, plan, torchioTransform)
+
+    def push(inputNode, future):
+      # The result is collected first, so no empty node is left if a worker failed
+      result, seconds = (None, 0) if future is None else future.result()
+      outputNode = slicer.mrmlScene.AddNewNodeByClass(
+        inputNode.GetClassName(),
+        f'{inputNode.GetName()} {transform.name}',
+      )
+      outputNode.SetAttribute(OUTPUT_ATTRIBUTE, transform.name)
+      if future is None:
+        transform.copyVolume(inputNode, outputNode)
+      elif inputNode.IsA('vtkMRMLLabelMapVolumeNode'):
+        transform.setLabelMapFromArray(result, inputNode, outputNode)
+      else:
+        transform.setVolumeNodeFromImage(result, outputNode)
+      outputNode.CreateDefaultDisplayNodes()
+      outputNodes.append(outputNode)
+      return seconds
+
+    outputNodes = []
+    pending = deque()
+    workerSeconds = 0
+    with self.showWaitCursor():
+      start = time.perf_counter()
+      with ThreadPoolExecutor(max_workers=numWorkers) as executor:
+        for inputNode in inputNodes:
+          if len(pending) == numWorkers:
+            workerSeconds += push(*pending.popleft())
+          pending.append((inputNode, submit(executor, inputNode)))
+        while pending:
+          workerSeconds += push(*pending.popleft())
+      wallSeconds = time.perf_counter() - start
+    logging.info(
+      f'Applied {transform.name} to {len(inputNodes)} volumes with {numWorkers}'
+      f' threads in {wallSeconds:.2f} s (summed worker time: {workerSeconds:.2f} s)'
+    )
+    return outputNodes, wallSeconds, workerSeconds
+
+  def sweepTransform(self, transform, inputNode, kwarg, numValues, montage=True):
+    values = transform.getSweepValues(kwarg, numValues)
+    with self.showWaitCursor():
+      images = transform.sweep(inputNode, kwarg, values)
+    name = f'{inputNode.GetName()} {transform.name} {kwarg} sweep'
+    className = inputNode.GetClassName()
+    if montage:
+      image = self.getMontage(images)
+      outputNode = slicer.mrmlScene.AddNewNodeByClass(className, name)
+      outputNode.SetAttribute(OUTPUT_ATTRIBUTE, transform.name)
+      transform.setVolumeNodeFromImage(image, outputNode)
+      outputNode.CreateDefaultDisplayNodes()
+    else:
+      sequenceNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLSequenceNode', name)
+      sequenceNode.SetAttribute(OUTPUT_ATTRIBUTE, transform.name)
+      sequenceNode.SetIndexName(kwarg)
+      sequenceNode.SetIndexUnit('')
+      frameNode = slicer.mrmlScene.AddNewNodeByClass(className)
+      for image, value in zip(images, values):
+        transform.setVolumeNodeFromImage(image, frameNode)
+        sequenceNode.SetDataNodeAtValue(frameNode, f'{value:.4g}')
+      slicer.mrmlScene.RemoveNode(frameNode)
+      outputNode = self.getSequenceProxyNode(sequenceNode)
+    return outputNode
+
+  def getDatasetWriter(self, fileFormat, outputDir):
+    if fileFormat == 'NIfTI':
+      return NiftiWriter(outputDir)
+    elif fileFormat == 'HDF5':
+      return Hdf5Writer(self.importOrInstall('h5py'), outputDir / 'dataset.h5')
+    elif fileFormat == 'Zarr':
+      return ZarrWriter(self.importOrInstall('zarr'), outputDir / 'dataset.zarr')
+    raise ValueError(f'Unknown format: {fileFormat}')
+
+  def exportAugmentedDataset(
+      self,
+      transform,
+      inputNode,
+      outputDir,
+      numCopies,
+      fileFormat='NIfTI',
+      maxQueueSize=4,
+      ):
+    """Write augmented copies of a volume while the next ones are computed.
+
+    Transformed images are handed to a writer thread through a bounded queue,
+    so computation and disk writes overlap. Returns the write speed in MB/s.
+    """
+    outputDir = Path(outputDir)
+    outputDir.mkdir(parents=True, exist_ok=True)
+    writer = self.getDatasetWriter(fileFormat, outputDir)
+    subject = transform.getSubjectFromVolumeNode(inputNode)
+    torchioTransform = transform.getTransform()
+    stem = inputNode.GetName().replace(' ', '_')
+    with self.showWaitCursor(), AsyncWriter(writer, maxQueueSize) as asyncWriter:
+      for i in range(numCopies):
+        transformed = torchioTransform(subject)
+        asyncWriter.put(f'{stem}_{i:04d}', transformed.image)
+    megabytesPerSecond = asyncWriter.megabytesPerSecond
+    logging.info(
+      f'Exported {numCopies} images to {outputDir} in {asyncWriter.seconds:.2f} s,'
+      f' {asyncWriter.writeSeconds:.2f} s of which writing ({megabytesPerSecond:.1f} MB/s)'
+    )
+    return megabytesPerSecond
+
+  def getMontage(self, images):
+    """Tile images along the first two axes, so that one slice shows them all."""
+    numImages = len(images)
+    numColumns = int(np.ceil(np.sqrt(numImages)))
+    numRows = int(np.ceil(numImages / numColumns))
+    first = images[0]
+    channels, si, sj, sk = first.shape
+    montage = first.data.new_full(
+      (channels, numColumns * si, numRows * sj, sk),
+      first.data.min().item(),
+    )
+    for index, image in enumerate(images):
+      row, column = divmod(index, numColumns)
+      i, j = column * si, row * sj
+      montage[:, i:i + si, j:j + sj] = image.data
+    return type(first)(tensor=montage, affine=first.affine)
+
+  def getSequenceProxyNode(self, sequenceNode):
+    sequencesLogic = slicer.modules.sequences.logic()
+    browserNode = sequencesLogic.GetFirstBrowserNodeForSequenceNode(sequenceNode)
+    if browserNode is None:
+      browserNode = slicer.mrmlScene.AddNewNodeByClass(
+        'vtkMRMLSequenceBrowserNode',
+        f'{sequenceNode.GetName()} browser',
+      )
+      browserNode.SetAndObserveMasterSequenceNodeID(sequenceNode.GetID())
+    sequencesLogic.UpdateProxyNodesFromSequences(browserNode)
+    proxyNode = browserNode.GetProxyNode(sequenceNode)
+    transformName = sequenceNode.GetAttribute(OUTPUT_ATTRIBUTE)
+    if transformName is not None:
+      proxyNode.SetAttribute(OUTPUT_ATTRIBUTE, transformName)
+    proxyNode.CreateDefaultDisplayNodes()
+    return proxyNode
 
 
 class TorchIOTransformsTest(ScriptedLoadableModuleTest):
@@ -246,6 +845,15 @@ class TorchIOTransformsTest(ScriptedLoadableModuleTest):
     """
     self.setUp()
     self.test_TorchIOTransforms()
+    self.test_Sweep()
+    self.test_Statistics()
+    self.test_MemoryStrategies()
+    self.test_LabelMapCrop()
+    self.test_ApplyToNodes()
+    self.test_Headless()
+    self.test_Sequence()
+    self.test_History()
+    self.test_Export()
     self.tearDown()
 
   def _delayDisplay(self, message):
@@ -270,3 +878,277 @@ class TorchIOTransformsTest(ScriptedLoadableModuleTest):
       )
       self._delayDisplay(f'{transformName} passed!')
     self._delayDisplay('Test passed!')
+
+  def test_Sweep(self):
+    import SampleData
+    volumeNode = SampleData.downloadSample('MRHead')
+    logic = TorchIOTransformsLogic()
+    transform = logic.getTransform('RandomGamma')
+    numValues = 4
+    montageNode = logic.sweepTransform(transform, volumeNode, 'log_gamma', numValues)
+    inputShape = slicer.util.arrayFromVolume(volumeNode).shape
+    montageShape = slicer.util.arrayFromVolume(montageNode).shape
+    self.assertEqual(montageShape, (inputShape[0], 2 * inputShape[1], 2 * inputShape[2]))
+    proxyNode = logic.sweepTransform(
+      transform, volumeNode, 'log_gamma', numValues, montage=False)
+    self.assertEqual(slicer.util.arrayFromVolume(proxyNode).shape, inputShape)
+    sceneNodes = logic.getVolumeNodes()
+    self.assertIn(volumeNode, sceneNodes)
+    self.assertNotIn(montageNode, sceneNodes)
+    self.assertNotIn(proxyNode, sceneNodes)
+    # The other parameters are the same for all values
+    for transformName, kwarg in (('RandomAffine', 'translation'), ('RandomMotion', 'degrees')):
+      transform = logic.getTransform(transformName)
+      first, second = transform.sweep(volumeNode, kwarg, [5, 5])
+      self.assertTrue(first.data.equal(second.data))
+    self._delayDisplay('Sweep test passed!')
+
+  def test_Statistics(self):
+    import SampleData
+    volumeNode = SampleData.downloadSample('MRHead')
+    outputNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLScalarVolumeNode')
+    transform = TorchIOTransformsLogic().getTransform('RandomGamma')
+    transform(volumeNode, outputNode, statistics=True, difference=True)
+    statistics = transform.lastStatistics
+    self.assertEqual(len(statistics['input']['histogram']), len(statistics['output']['histogram']))
+    self.assertLessEqual(statistics['output']['P5'], statistics['output']['P95'])
+    inputShape = slicer.util.arrayFromVolume(volumeNode).shape
+    self.assertEqual(transform.lastDifference.shape[1:], inputShape[::-1])
+    self.assertIsNone(transform.lastDifferenceError)
+    self._delayDisplay('Statistics test passed!')
+
+  def test_MemoryStrategies(self):
+    import torch
+    logic = TorchIOTransformsLogic()
+    shape = 32, 32, 32
+    numVoxels = int(np.prod(shape))
+    sliceVoxels = numVoxels // shape[0]
+
+    doubleNode = slicer.util.addVolumeFromArray(np.random.rand(*shape))
+    blur = logic.getTransform('RandomBlur')
+    # Full: 8 + 4 * 8 bytes per voxel; single precision: 8 + 4 * 4
+    blur.memoryBudget = 30 * numVoxels
+    self.assertEqual(blur.chooseStrategy(doubleNode)['strategy'], 'reduced')
+
+    floatNode = slicer.util.addVolumeFromArray(np.random.rand(*shape).astype(np.float32))
+    gamma = logic.getTransform('RandomGamma')
+    # Room for the input, its float copy and four slices per working copy
+    gamma.memoryBudget = 8 * numVoxels + 4 * sliceVoxels * gamma.memoryFactor * 4
+    plan = gamma.chooseStrategy(floatNode)
+    self.assertEqual(plan['strategy'], 'chunked')
+    self.assertEqual(plan['chunkSlices'], 4)
+    subject = gamma.getSubjectFromVolumeNode(floatNode)
+    chunkedImage = gamma.getTransformedImage(subject, plan)
+    deterministicTransform = gamma.lastAppliedTransform
+    fullImage = deterministicTransform(gamma.getSubjectFromVolumeNode(floatNode)).image
+    self.assertTrue(torch.allclose(chunkedImage.data, fullImage.data))
+    # The input is not kept whole, so there is no difference to compute
+    outputNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLScalarVolumeNode')
+    gamma(floatNode, outputNode, difference=True)
+    self.assertIsNone(gamma.lastDifference)
+    self.assertIn('chunked', gamma.lastDifferenceError)
+
+    gamma.memoryBudget = 1
+    with self.assertRaises(MemoryError):
+      gamma.chooseStrategy(floatNode)
+
+    roiShape = 48, 48, 48
+    roiArray = np.zeros(roiShape, np.float32)
+    roiArray[16:32, 16:32, 16:32] = np.random.rand(16, 16, 16)
+    roiNode = slicer.util.addVolumeFromArray(roiArray)
+    blur.getKwargs = lambda: {'std': (2, 2)}
+    # Full: 4 + 4 * 4 bytes per voxel; the bounding box with its margins is smaller
+    blur.memoryBudget = 19 * int(np.prod(roiShape))
+    plan = blur.chooseStrategy(roiNode)
+    self.assertEqual(plan['strategy'], 'roi')
+    self.assertLess(plan['bounds'][0][1] - plan['bounds'][0][0], roiShape[0])
+    subject = blur.getSubjectFromVolumeNode(roiNode)
+    roiImage = blur.getTransformedImage(subject, plan)
+    deterministicTransform = blur.lastAppliedTransform
+    fullImage = deterministicTransform(blur.getSubjectFromVolumeNode(roiNode)).image
+    self.assertTrue(torch.allclose(roiImage.data, fullImage.data, atol=1e-6))
+    self._delayDisplay('Memory strategies test passed!')
+
+  def test_LabelMapCrop(self):
+    array = np.zeros((64, 64, 64), np.uint8)
+    array[8:20, 40:54, 10:22] = 1  # far from the center
+    labelNode = slicer.util.addVolumeFromArray(
+      array, nodeClassName='vtkMRMLLabelMapVolumeNode')
+    outputNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLLabelMapVolumeNode')
+    transform = TorchIOTransformsLogic().getTransform('RandomAffine')
+    kwargs = transform.getKwargs()
+    kwargs.update(scales=(1.1, 1.1), degrees=(10, 10), translation=(2, 2))
+    transform.getKwargs = lambda: kwargs
+    transform(labelNode, outputNode)
+    croppedArray = slicer.util.arrayFromVolume(outputNode)
+    subject = transform.getSubjectFromVolumeNode(labelNode)
+    fullArray = transform.getTransform()(subject).image.data[0].numpy().transpose(2, 1, 0)
+    self.assertGreater(croppedArray.sum(), 0)
+    numDifferent = np.count_nonzero(croppedArray != fullArray)
+    # Only a few voxels on the border may be rounded differently
+    self.assertLess(numDifferent, 0.01 * array.sum())
+    self._delayDisplay('Label map crop test passed!')
+
+  def test_ApplyToNodes(self):
+    slicer.mrmlScene.Clear(0)
+    logic = TorchIOTransformsLogic()
+    scalarNode = slicer.util.addVolumeFromArray(
+      np.random.rand(24, 32, 40).astype(np.float32), name='Scalar')
+    labelArray = np.zeros((24, 32, 40), np.uint8)
+    labelArray[4:10, 20:28, 5:15] = 2
+    labelNode = slicer.util.addVolumeFromArray(
+      labelArray, name='Label', nodeClassName='vtkMRMLLabelMapVolumeNode')
+    scalarNodes = logic.getVolumeNodes(
+      className='vtkMRMLScalarVolumeNode', excludedClassName='vtkMRMLLabelMapVolumeNode')
+    self.assertEqual(scalarNodes, [scalarNode])
+    transform = logic.getTransform('RandomAffine')
+    outputNodes, _, _ = logic.applyTransformToNodes(
+      transform, [scalarNode, labelNode], numWorkers=2)
+    self.assertEqual([node.GetName() for node in outputNodes], ['Scalar RandomAffine', 'Label RandomAffine'])
+    self.assertTrue(outputNodes[1].IsA('vtkMRMLLabelMapVolumeNode'))
+    for inputNode, outputNode in zip((scalarNode, labelNode), outputNodes):
+      inputShape = slicer.util.arrayFromVolume(inputNode).shape
+      self.assertEqual(slicer.util.arrayFromVolume(outputNode).shape, inputShape)
+    self.assertEqual(set(np.unique(slicer.util.arrayFromVolume(outputNodes[1]))), {0, 2})
+    # Outputs are not transformed again
+    self.assertEqual(logic.getVolumeNodes(), [scalarNode, labelNode])
+
+    # No empty output is left if a worker fails
+    def fail(*args):
+      raise RuntimeError('Transform failed')
+    transform.getTransformedImage = fail
+    numVolumes = len(slicer.util.getNodesByClass('vtkMRMLVolumeNode'))
+    with self.assertRaises(RuntimeError):
+      logic.applyTransformToNodes(transform, [scalarNode])
+    self.assertEqual(len(slicer.util.getNodesByClass('vtkMRMLVolumeNode')), numVolumes)
+    self._delayDisplay('Apply to nodes test passed!')
+
+  def test_Headless(self):
+    import torch
+    import torchio
+    from TorchIOTransformsLib import Headless
+    tempDir = Path(slicer.util.tempDirectory())
+    for subject in ('a', 'b'):
+      (tempDir / subject).mkdir()
+      image = torchio.ScalarImage(tensor=torch.rand(1, 10, 12, 14))
+      image.save(tempDir / subject / 'image.nii.gz')
+    config = {
+      'transforms': [{'name': 'RandomGamma'}],
+      'inputs': [str(tempDir / '*' / 'image.nii.gz')],
+      'output_dir': str(tempDir / 'output'),
+      'workers': 2,
+    }
+    numThreads = torch.get_num_threads()
+    report = Headless.run(config)
+    self.assertEqual(report['num_errors'], 0)
+    self.assertEqual(torch.get_num_threads(), numThreads)
+    for subject in ('a', 'b'):
+      outputImage = torchio.ScalarImage(tempDir / 'output' / subject / 'image.nii.gz')
+      self.assertEqual(outputImage.shape, (1, 10, 12, 14))
+    self.assertTrue((tempDir / 'output' / 'report.json').is_file())
+    # Files with the same name would overwrite each other
+    config['inputs'] = [str(tempDir / subject / '*.nii.gz') for subject in ('a', 'b')]
+    with self.assertRaises(ValueError):
+      Headless.run(config)
+    self._delayDisplay('Headless test passed!')
+
+  def test_Sequence(self):
+    inputSequenceNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLSequenceNode')
+    frameArray = np.random.rand(16, 20, 24).astype(np.float32)
+    frameNode = slicer.util.addVolumeFromArray(frameArray)
+    indexValues = [str(10 * i) for i in range(5)]
+    for indexValue in indexValues:
+      inputSequenceNode.SetDataNodeAtValue(frameNode, indexValue)
+    slicer.mrmlScene.RemoveNode(frameNode)
+    outputSequenceNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLSequenceNode')
+    transform = TorchIOTransformsLogic().getTransform('RandomGamma')
+    transform(inputSequenceNode, outputSequenceNode, framesPerBatch=2)
+    numFrames = outputSequenceNode.GetNumberOfDataNodes()
+    self.assertEqual(numFrames, len(indexValues))
+    outputIndexValues = [outputSequenceNode.GetNthIndexValue(i) for i in range(numFrames)]
+    self.assertEqual(outputIndexValues, indexValues)
+    # All frames are equal, so they stay equal if they share one transform
+    firstArray = slicer.util.arrayFromVolume(outputSequenceNode.GetNthDataNode(0))
+    for i in range(1, numFrames):
+      array = slicer.util.arrayFromVolume(outputSequenceNode.GetNthDataNode(i))
+      self.assertTrue(np.array_equal(array, firstArray))
+    volumeNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLScalarVolumeNode')
+    with self.assertRaises(TypeError):
+      transform(inputSequenceNode, volumeNode)
+
+    # Without an output node, as with "Create new volume" in the widget
+    logic = TorchIOTransformsLogic()
+    newSequenceNode = logic.applyTransform(inputSequenceNode, None, 'RandomGamma')
+    self.assertTrue(newSequenceNode.IsA('vtkMRMLSequenceNode'))
+    self.assertEqual(newSequenceNode.GetNumberOfDataNodes(), len(indexValues))
+    proxyNode = logic.getSequenceProxyNode(newSequenceNode)
+    self.assertIsNotNone(proxyNode.GetDisplayNode())
+    self._delayDisplay('Sequence test passed!')
+
+  def test_History(self):
+    ijkToRAS = np.eye(4)
+    arrays = [np.random.randint(-2 ** 15, 2 ** 15, (8, 10, 12), dtype=np.int16) for _ in range(5)]
+    history = TransformHistory(maxEntries=3)
+    for i, array in enumerate(arrays):
+      history.add(str(i), 'vtkMRMLScalarVolumeNode1', array, ijkToRAS)
+    self.assertEqual([entry.description for entry in history], ['2', '3', '4'])
+    entry = history[-1]
+    self.assertEqual(entry.getArray().dtype, np.int16)
+    self.assertTrue(np.array_equal(entry.getArray(), arrays[-1]))
+    self.assertTrue(np.array_equal(entry.ijkToRAS, ijkToRAS))
+
+    # Random values are barely compressible
+    history = TransformHistory(maxBytes=int(2.5 * arrays[0].nbytes))
+    for i, array in enumerate(arrays):
+      history.add(str(i), 'vtkMRMLScalarVolumeNode1', array, ijkToRAS)
+    self.assertEqual(len(history), 2)
+    self.assertLessEqual(history.numBytes, history.maxBytes)
+
+    # Outputs that do not fit are kept only as a replay function, or not at all
+    history = TransformHistory(maxBytes=100)
+    entry = history.add('big', 'vtkMRMLScalarVolumeNode1', arrays[0], ijkToRAS, replay=lambda: None)
+    self.assertIsNone(entry.compressed)
+    self.assertEqual(history.numBytes, 0)
+    self.assertIsNone(history.add('big', 'vtkMRMLScalarVolumeNode1', arrays[0], ijkToRAS))
+    self.assertEqual(len(history), 1)
+    history.remove(entry)
+    self.assertEqual(len(history), 0)
+    history.clear()
+    self.assertEqual(len(history), 0)
+    self._delayDisplay('History test passed!')
+
+  def test_Export(self):
+    volumeNode = slicer.util.addVolumeFromArray(
+      np.random.rand(16, 20, 24).astype(np.float32), name='Export test')
+    transform = TorchIOTransformsLogic().getTransform('RandomGamma')
+    outputDir = Path(slicer.util.tempDirectory())
+    megabytesPerSecond = TorchIOTransformsLogic().exportAugmentedDataset(
+      transform, volumeNode, outputDir, 3)
+    self.assertGreater(megabytesPerSecond, 0)
+    paths = sorted(path.name for path in outputDir.glob('*.nii.gz'))
+    self.assertEqual(paths, [f'Export_test_{i:04d}.nii.gz' for i in range(3)])
+
+    # A gamma of 1 leaves the intensities unchanged, so the stores can be compared to the input
+    transform.getKwargs = lambda: {'log_gamma': (0, 0)}
+    logic = TorchIOTransformsLogic()
+    inputArray = slicer.util.arrayFromVolume(volumeNode)
+    ijkToRAS = logic.getIJKToRASArray(volumeNode)
+    for fileFormat, fileName in (('HDF5', 'dataset.h5'), ('Zarr', 'dataset.zarr')):
+      outputDir = Path(slicer.util.tempDirectory())
+      logic.exportAugmentedDataset(transform, volumeNode, outputDir, 2, fileFormat=fileFormat)
+      if fileFormat == 'HDF5':
+        h5py = logic.importOrInstall('h5py')
+        with h5py.File(outputDir / fileName, 'r') as f:
+          arrays = {name: (f[name][()], f[name].attrs['affine']) for name in f}
+      else:
+        zarr = logic.importOrInstall('zarr')
+        group = zarr.open_group(str(outputDir / fileName), mode='r')
+        arrays = {
+          name: (group[name][...], np.array(group[name].attrs['affine']))
+          for name in group.array_keys()
+        }
+      self.assertEqual(sorted(arrays), ['Export_test_0000', 'Export_test_0001'])
+      for data, affine in arrays.values():
+        self.assertTrue(np.allclose(data[0].transpose(2, 1, 0), inputArray))
+        self.assertTrue(np.allclose(affine, ijkToRAS))
+    self._delayDisplay('Export test passed!')
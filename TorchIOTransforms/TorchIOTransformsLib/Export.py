@@ -0,0 +1,126 @@
+import time
+import queue
+import threading
+from pathlib import Path
+
+
+FORMATS = 'NIfTI', 'HDF5', 'Zarr'
+
+
+def getChunks(shape, chunkSize=64):
+    channels, *spatialShape = shape
+    return (1,) + tuple(min(n, chunkSize) for n in spatialShape)
+
+
+class NiftiWriter:
+    def __init__(self, outputDir):
+        self.outputDir = Path(outputDir)
+
+    def __call__(self, name, image):
+        image.save(self.outputDir / f'{name}.nii.gz')
+
+    def close(self):
+        pass
+
+
+class Hdf5Writer:
+    def __init__(self, h5py, path):
+        self.file = h5py.File(path, 'a')
+
+    def __call__(self, name, image):
+        if name in self.file:
+            del self.file[name]
+        dataset = self.file.create_dataset(
+            name,
+            data=image.data.numpy(),
+            chunks=getChunks(image.shape),
+            compression='gzip',
+            compression_opts=1,
+        )
+        dataset.attrs['affine'] = image.affine
+
+    def close(self):
+        self.file.close()
+
+
+class ZarrWriter:
+    """Write images to a Zarr group, with either zarr 2 or zarr 3."""
+    def __init__(self, zarr, path):
+        self.isZarr2 = int(zarr.__version__.split('.')[0]) < 3
+        self.group = zarr.open_group(str(path), mode='a')
+
+    def __call__(self, name, image):
+        data = image.data.numpy()
+        kwargs = dict(
+            shape=data.shape,
+            dtype=data.dtype,
+            chunks=getChunks(image.shape),
+            overwrite=True,
+        )
+        if self.isZarr2:
+            array = self.group.create_dataset(name, **kwargs)
+        else:
+            array = self.group.create_array(name, **kwargs)
+        array[...] = data
+        array.attrs['affine'] = image.affine.tolist()
+
+    def close(self):
+        pass
+
+
+class AsyncWriter:
+    """Write images in a background thread while the caller keeps computing.
+
+    The queue is bounded, so ``put`` blocks if the writer falls behind, which
+    keeps the number of images waiting in memory at ``maxQueueSize``.
+    ``seconds`` is the time from entering to leaving the context, including
+    the caller's computation, and ``writeSeconds`` the time spent writing.
+    """
+    def __init__(self, writer, maxQueueSize=4):
+        self.writer = writer
+        self.queue = queue.Queue(maxsize=maxQueueSize)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.numBytes = 0
+        self.seconds = 0
+        self.writeSeconds = 0
+        self.error = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.thread.start()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.queue.put(None)
+        self.thread.join()
+        self.writer.close()
+        self.seconds = time.perf_counter() - self.start
+        if excType is not None:
+            return  # let the exception raised in the context propagate
+        if self.error is not None:
+            raise self.error
+
+    def put(self, name, image):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((name, image))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue  # drain the queue so that put() does not block
+            name, image = item
+            start = time.perf_counter()
+            try:
+                self.writer(name, image)
+                self.numBytes += image.data.nbytes
+            except Exception as error:
+                self.error = error
+            self.writeSeconds += time.perf_counter() - start
+
+    @property
+    def megabytesPerSecond(self):
+        return self.numBytes / 1024 ** 2 / self.writeSeconds if self.writeSeconds else 0
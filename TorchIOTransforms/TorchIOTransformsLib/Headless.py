@@ -0,0 +1,160 @@
+"""Apply TorchIO transforms to files without constructing any widgets.
+
+This script can be run with plain Python if TorchIO is installed, or with
+Slicer::
+
+    python Headless.py config.json
+    Slicer --no-main-window --python-script Headless.py config.json
+
+Example configuration file::
+
+    {
+        "transforms": [
+            {"name": "RandomBlur", "kwargs": {"std": [0, 2]}},
+            {"name": "RandomGamma"}
+        ],
+        "inputs": ["/data/images/*.nii.gz"],
+        "label": false,
+        "output_dir": "/data/augmented",
+        "workers": 4
+    }
+
+Transform names are the ones in the TorchIO Transforms module. Outputs keep
+the path of each input relative to the directory before the first wildcard
+of its pattern, so files with the same name in different directories do not
+overwrite each other. Files are processed in a thread pool and a JSON report with the time spent on each
+file and the total time is written to ``report.json`` in the output
+directory, unless another path is given with the ``report`` key.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from glob import glob
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+
+def getTransform(config):
+    import torchio
+    transforms = []
+    for transformConfig in config['transforms']:
+        name = transformConfig['name']
+        klass = getattr(torchio, name, None)
+        if klass is None:
+            raise ValueError(f'Transform "{name}" not found in TorchIO')
+        transforms.append(klass(**transformConfig.get('kwargs', {})))
+    return torchio.Compose(transforms)
+
+
+def getGlobRoot(pattern):
+    """Return the directory before the first wildcard of a pattern."""
+    parts = Path(pattern).parts
+    for index, part in enumerate(parts):
+        if any(character in part for character in '*?['):
+            return Path(*parts[:index])
+    return Path(pattern).parent
+
+
+def getInputPaths(config):
+    """Return the input paths and their paths relative to the roots of their patterns."""
+    paths = []
+    for pattern in config['inputs']:
+        pattern = os.path.expanduser(pattern)
+        root = getGlobRoot(pattern)
+        for path in sorted(Path(path) for path in glob(pattern, recursive=True)):
+            paths.append((path, path.relative_to(root)))
+    if not paths:
+        raise FileNotFoundError(f'No files found matching {config["inputs"]}')
+    outputPaths = {}
+    for path, relativePath in paths:
+        if relativePath in outputPaths:
+            message = (
+                f'{outputPaths[relativePath]} and {path} would be written'
+                f' to the same output path, {relativePath}'
+            )
+            raise ValueError(message)
+        outputPaths[relativePath] = path
+    return paths
+
+
+def transformFile(inputPath, relativePath, transform, outputDir, label=False):
+    import torchio
+    start = time.perf_counter()
+    imageClass = torchio.LabelMap if label else torchio.ScalarImage
+    subject = torchio.Subject(image=imageClass(inputPath))
+    transformed = transform(subject)
+    outputPath = outputDir / relativePath
+    outputPath.parent.mkdir(parents=True, exist_ok=True)
+    transformed.image.save(outputPath)
+    seconds = time.perf_counter() - start
+    logging.info(f'{inputPath} -> {outputPath} ({seconds:.2f} s)')
+    return {
+        'input': str(inputPath),
+        'output': str(outputPath),
+        'transform': str(transformed.get_applied_transforms()),
+        'seconds': seconds,
+    }
+
+
+def run(config):
+    import torch
+    transform = getTransform(config)
+    inputPaths = getInputPaths(config)
+    outputDir = Path(os.path.expanduser(config['output_dir']))
+    outputDir.mkdir(parents=True, exist_ok=True)
+    numWorkers = config.get('workers', 1)
+    label = config.get('label', False)
+
+    def process(paths):
+        inputPath, relativePath = paths
+        try:
+            return transformFile(inputPath, relativePath, transform, outputDir, label=label)
+        except Exception as error:
+            logging.error(f'Error transforming {inputPath}: {error}')
+            return {'input': str(inputPath), 'error': str(error)}
+
+    # Avoid oversubscription, as each worker can use several threads. This is
+    # global to the process (e.g. Slicer), so the previous value is restored
+    previousNumThreads = torch.get_num_threads()
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // numWorkers))
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=numWorkers) as executor:
+            results = list(executor.map(process, inputPaths))
+    finally:
+        torch.set_num_threads(previousNumThreads)
+    totalSeconds = time.perf_counter() - start
+    report = {
+        'workers': numWorkers,
+        'total_seconds': totalSeconds,
+        'sum_seconds': sum(result.get('seconds', 0) for result in results),
+        'num_errors': sum('error' in result for result in results),
+        'files': results,
+    }
+    reportPath = Path(config.get('report', outputDir / 'report.json'))
+    with open(reportPath, 'w') as f:
+        json.dump(report, f, indent=2)
+    logging.info(
+        f'Transformed {len(results)} files in {totalSeconds:.2f} s.'
+        f' Report written to {reportPath}'
+    )
+    return report
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Apply TorchIO transforms to files')
+    parser.add_argument('config', help='path to a JSON configuration file')
+    arguments = parser.parse_args(args)
+    logging.basicConfig(level=logging.INFO)
+    with open(arguments.config) as f:
+        config = json.load(f)
+    report = run(config)
+    return 1 if report['num_errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+import zlib
+import logging
+from collections import deque
+
+import numpy as np
+
+
+class HistoryEntry:
+    def __init__(self, description, outputNodeID, compressed, shape, dtype, ijkToRAS, replay, inputNodeID=None):
+        self.description = description
+        self.outputNodeID = outputNodeID
+        self.inputNodeID = inputNodeID
+        self.compressed = compressed
+        self.shape = shape
+        self.dtype = dtype
+        self.ijkToRAS = ijkToRAS
+        self.replay = replay
+
+    @property
+    def numBytes(self):
+        return 0 if self.compressed is None else len(self.compressed)
+
+    def getArray(self):
+        array = np.frombuffer(zlib.decompress(self.compressed), dtype=self.dtype)
+        return array.reshape(self.shape)
+
+
+class TransformHistory:
+    """Keep the last outputs of a transform, compressed in memory.
+
+    Entries are dropped, oldest first, when there are more than
+    ``maxEntries`` or their total size exceeds ``maxBytes``. An output that
+    does not fit in ``maxBytes`` even after compression is kept only as a
+    function that recomputes it, typically by replaying the deterministic
+    transform that produced it. If there is no such function, the output is
+    not added, so the total size never exceeds ``maxBytes``.
+    """
+    def __init__(self, maxEntries=10, maxBytes=512 * 1024 ** 2, compressionLevel=1):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.compressionLevel = compressionLevel
+        self.entries = deque()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, index):
+        return self.entries[index]
+
+    @property
+    def numBytes(self):
+        return sum(entry.numBytes for entry in self.entries)
+
+    def add(self, description, outputNodeID, array, ijkToRAS, replay=None, inputNodeID=None):
+        """Add an output and return its entry, or None if it does not fit."""
+        compressed = zlib.compress(np.ascontiguousarray(array), self.compressionLevel)
+        if len(compressed) > self.maxBytes:
+            if replay is None:
+                logging.warning(
+                    f'Output of {len(compressed)} bytes not added to the history,'
+                    f' as it exceeds {self.maxBytes} bytes and cannot be recomputed'
+                )
+                return None
+            compressed = None
+        entry = HistoryEntry(
+            description,
+            outputNodeID,
+            compressed,
+            array.shape,
+            array.dtype,
+            np.array(ijkToRAS),
+            replay,
+            inputNodeID=inputNodeID,
+        )
+        self.entries.append(entry)
+        self.trim()
+        return entry
+
+    def trim(self):
+        while len(self.entries) > self.maxEntries or self.numBytes > self.maxBytes:
+            if len(self.entries) == 1:
+                break
+            self.entries.popleft()
+
+    def remove(self, entry):
+        self.entries.remove(entry)
+
+    def clear(self):
+        self.entries.clear()
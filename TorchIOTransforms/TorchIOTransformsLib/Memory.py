@@ -0,0 +1,31 @@
+import os
+import logging
+
+
+def getAvailableMemory():
+    """Return the available system memory in bytes, or None if unknown."""
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        logging.warning('Available memory could not be determined')
+        return None
+
+
+def formatBytes(numBytes):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if numBytes < 1024:
+            return f'{numBytes:.1f} {unit}'
+        numBytes /= 1024
+    return f'{numBytes:.1f} TB'
@@ -1,9 +1,13 @@
 import qt
+import numpy as np
 
 from .Transform import Transform
 
 
 class RandomAffine(Transform):
+    isSpatial = True
+    memoryFactor = 6
+
     def setup(self):
         scale = self.getDefaultValue('scales')
         scales = 1 - scale, 1 + scale
@@ -39,6 +43,44 @@ class RandomAffine(Transform):
             value = text
         return value
 
+    def getLabelMargin(self, roiSize, spacing, offset):
+        kwargs = self.getKwargs()
+        scales = kwargs['scales']
+        maxScale = max(max(scales), 1 / min(scales))
+        maxTranslation = max(np.abs(kwargs['translation']))
+        maxDegrees = max(np.abs(kwargs['degrees']))
+        if maxDegrees > 0:
+            # Any rotation keeps the region within its circumscribed sphere,
+            # whose center moves as it is rotated about the volume center
+            halfSize = np.full(3, np.linalg.norm(roiSize) / 2)
+            angle = min(np.pi, 3 * np.radians(maxDegrees))
+            shift = (maxScale - 1 + 2 * maxScale * np.sin(angle / 2)) * np.linalg.norm(offset)
+        else:
+            halfSize = roiSize / 2
+            shift = (maxScale - 1) * np.abs(offset)
+        return np.maximum(0, halfSize * maxScale - roiSize / 2) + shift + maxTranslation
+
+    def getLabelTransform(self):
+        # Sample the parameters once and use them about the center of the
+        # volume, which is at the origin for the label bounding box
+        import torchio
+        kwargs = self.getKwargs()
+        randomAffine = self.getTransform()
+        scales, degrees, translation = randomAffine.get_params(
+            randomAffine.scales,
+            randomAffine.degrees,
+            randomAffine.translation,
+            randomAffine.isotropic,
+        )
+        return torchio.Affine(
+            scales.tolist(),
+            degrees.tolist(),
+            translation.tolist(),
+            center='origin',
+            image_interpolation=kwargs['image_interpolation'],
+            default_pad_value=kwargs['default_pad_value'],
+        )
+
     def getKwargs(self):
         kwargs = dict(
             scales=self.getSliderRange(self.scalesSlider),
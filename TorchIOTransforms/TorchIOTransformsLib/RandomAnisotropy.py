@@ -2,6 +2,9 @@ from .Transform import Transform
 
 
 class RandomAnisotropy(Transform):
+    isSpatial = True
+    memoryFactor = 4
+
     def setup(self):
         self.axesLayout, self.axesDict = self.makeAxesLayout()
         self.layout.addRow('Axes: ', self.axesLayout)
@@ -11,6 +14,15 @@ class RandomAnisotropy(Transform):
             1, a, b, 10, 0.01, 'downsampling')
         self.layout.addRow('Downsampling factor: ', self.downsamplingSlider)
 
+    def getLabelMargin(self, roiSize, spacing, offset):
+        _, maxDownsampling = self.getSliderRange(self.downsamplingSlider)
+        return maxDownsampling * spacing
+
+    def getSweepKwargs(self, kwarg, value):
+        kwargs = super().getSweepKwargs(kwarg, value)
+        kwargs['axes'] = kwargs['axes'][:1]  # the axis would be chosen at random
+        return kwargs
+
     def getKwargs(self):
         kwargs = dict(
             axes=tuple([n for n in range(3) if self.axesDict[n].isChecked()]),
@@ -5,6 +5,8 @@ from .Transform import Transform
 
 
 class RandomBiasField(Transform):
+    memoryFactor = 4
+
     def setup(self):
         self.coefficientsSlider = slicer.qMRMLSliderWidget()
         self.coefficientsSlider.singleStep = 0.01
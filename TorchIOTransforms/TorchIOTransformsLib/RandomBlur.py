@@ -1,12 +1,23 @@
+import numpy as np
+
 from .Transform import Transform
 
 
 class RandomBlur(Transform):
+    memoryFactor = 4
+    isLocal = True
+
     def setup(self):
         stds = self.getDefaultValue('std')
         self.stdSlider = self.makeRangeWidget(0, *stds, 5, 0.01, 'std')
         self.layout.addRow('Standard deviation: ', self.stdSlider)
 
+    def getRoiMargins(self, spacing):
+        # TorchIO uses scipy.ndimage.gaussian_filter, whose kernel is
+        # truncated at four standard deviations, converted from mm to voxels
+        maxStd = max(self.getKwargs()['std'])
+        return (np.ceil(4 * maxStd / spacing).astype(int) + 1).tolist()
+
     def getKwargs(self):
         kwargs = dict(
             std=self.getSliderRange(self.stdSlider),
@@ -5,6 +5,9 @@ from .CoordinatesWidget import CoordinatesWidget
 
 
 class RandomElasticDeformation(Transform):
+    isSpatial = True
+    memoryFactor = 10
+
     def setup(self):
         self.controlPointsWidget = CoordinatesWidget(
             decimals=0,
@@ -2,6 +2,9 @@ from .Transform import Transform
 
 
 class RandomGamma(Transform):
+    isPointwise = True
+    isLocal = True
+
     def setup(self):
         logs = self.getDefaultValue('log_gamma')
         self.logGammaSlider = self.makeRangeWidget(-2, *logs, 2, 0.01, 'log_gamma')
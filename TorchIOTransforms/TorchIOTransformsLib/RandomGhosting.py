@@ -6,6 +6,8 @@ from .Transform import Transform
 
 
 class RandomGhosting(Transform):
+    memoryFactor = 8
+
     def setup(self):
         self.numGhostsSpinBox = qt.QSpinBox()
         self.numGhostsSpinBox.maximum = 50
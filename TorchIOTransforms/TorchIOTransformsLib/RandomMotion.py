@@ -4,6 +4,10 @@ from .Transform import Transform
 
 
 class RandomMotion(Transform):
+    isSpatial = True
+    memoryFactor = 12
+    sweepWithSeed = True  # the times of the motions are random
+
     def setup(self):
         degrees = self.getDefaultValue('degrees')
         self.degreesSlider = self.makeRangeWidget(
@@ -6,6 +6,8 @@ from .Transform import Transform
 
 
 class RandomSpike(Transform):
+    memoryFactor = 8
+
     def setup(self):
         self.numSpikesSpinBox = qt.QSpinBox()
         self.numSpikesSpinBox.maximum = 10
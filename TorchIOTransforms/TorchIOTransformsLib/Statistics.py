@@ -0,0 +1,53 @@
+PERCENTILES = 1, 5, 50, 95, 99
+SPARKLINE_CHARACTERS = ' ▁▂▃▄▅▆▇█'
+
+
+def sampleVoxels(tensor, numSamples=1000000):
+    """Return a random sample of the voxel values, without copying the tensor."""
+    import torch
+    flat = tensor.reshape(-1)
+    if flat.numel() > numSamples:
+        indices = torch.randint(flat.numel(), (numSamples,))
+        flat = flat[indices]
+    return flat.double()
+
+
+def getSummary(sample, low, high, numBins=64):
+    """Compute statistics and a histogram in the range ``[low, high]`` of a sample."""
+    import torch
+    quantiles = torch.quantile(sample, torch.tensor(PERCENTILES, dtype=sample.dtype) / 100)
+    std, mean = torch.std_mean(sample)
+    histogram = torch.histc(sample, bins=numBins, min=low, max=high)
+    summary = {
+        'Min': sample.min().item(),
+        'Max': sample.max().item(),
+        'Mean': mean.item(),
+        'Std': std.item(),
+    }
+    for percentile, quantile in zip(PERCENTILES, quantiles.tolist()):
+        summary[f'P{percentile}'] = quantile
+    summary['histogram'] = histogram.tolist()
+    return summary
+
+
+def getSummaries(inputSample, outputSample, numBins=64):
+    """Summarize input and output samples with histograms on a shared range."""
+    low = min(inputSample.min().item(), outputSample.min().item())
+    high = max(inputSample.max().item(), outputSample.max().item())
+    return {
+        'input': getSummary(inputSample, low, high, numBins),
+        'output': getSummary(outputSample, low, high, numBins),
+        'range': (low, high),
+    }
+
+
+def getSparkline(counts):
+    """Represent a histogram as a line of text, with logarithmic heights."""
+    import torch
+    logCounts = torch.log1p(torch.as_tensor(counts, dtype=torch.float64))
+    maxCount = logCounts.max().item()
+    if maxCount == 0:
+        return len(counts) * SPARKLINE_CHARACTERS[0]
+    numLevels = len(SPARKLINE_CHARACTERS) - 1
+    levels = (logCounts / maxCount * numLevels).round().long()
+    return ''.join(SPARKLINE_CHARACTERS[level] for level in levels.tolist())
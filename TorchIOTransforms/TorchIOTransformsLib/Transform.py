@@ -1,16 +1,47 @@
+import os
 import logging
 import inspect
 import importlib
+from concurrent.futures import ThreadPoolExecutor
 
 import qt
+import vtk
+import numpy as np
 import slicer
 import sitkUtils as su
 
+from .Memory import getAvailableMemory, formatBytes
+from .Statistics import sampleVoxels, getSummaries
+
 
 class Transform:
+    # Working copies of the volume, in at least single precision, needed at peak
+    memoryFactor = 3
+    # Voxels are moved, so transforming a crop would not be equivalent
+    isSpatial = False
+    # Each output voxel depends only on the same input voxel
+    isPointwise = False
+    # Each output voxel depends only on a small neighborhood of the same input
+    # voxel, so transforming the foreground bounding box padded with the
+    # margins from getRoiMargins is equivalent
+    isLocal = False
+    # Maximum memory in bytes; if None, only the available memory is considered
+    memoryBudget = None
+    availableMemoryFraction = 0.8
+    roiMargin = 10
+    # Parameters other than the ranges are sampled at random, so each value
+    # of a sweep is computed serially from the same random seed
+    sweepWithSeed = False
+
     def __init__(self):
         self.groupBox = qt.QGroupBox('Parameters')
         self.layout = qt.QFormLayout(self.groupBox)
+        self.rangeWidgets = {}
+        self.lastAppliedTransform = None
+        self.lastStrategy = None
+        self.lastStatistics = None
+        self.lastDifference = None
+        self.lastDifferenceError = None
         self.setup()
 
     def getHelpLink(self):
@@ -72,6 +103,7 @@ class Transform:
         slider.singleStep = step
         slider.setToolTip(self.getArgDocstring(name))
         slider.symmetricMoves = True
+        self.rangeWidgets[name] = slider
         return slider
 
     def makeAxesLayout(self):
@@ -109,19 +141,473 @@ class Transform:
     def getSliderRange(self, slider):
         return slider.minimumValue, slider.maximumValue
 
-    def __call__(self, inputVolumeNode, outputVolumeNode):
+    def getSweepableKwargs(self):
+        return list(self.rangeWidgets)
+
+    def getSweepValues(self, kwarg, numValues):
+        slider = self.rangeWidgets[kwarg]
+        values = np.linspace(slider.minimumValue, slider.maximumValue, numValues)
+        return values.tolist()
+
+    def getSubjectFromVolumeNode(self, volumeNode):
         import torchio
-        image = su.PullVolumeFromSlicer(inputVolumeNode)
+        image = su.PullVolumeFromSlicer(volumeNode)
         tensor, affine = torchio.io.sitk_to_nib(image)
-        if inputVolumeNode.IsA('vtkMRMLScalarVolumeNode'):
-            image = torchio.ScalarImage(tensor=tensor, affine=affine)
-        elif inputVolumeNode.IsA('vtkMRMLLabelMapVolumeNode'):
+        # Label maps are also scalar volume nodes, so they are checked first
+        if volumeNode.IsA('vtkMRMLLabelMapVolumeNode'):
             image = torchio.LabelMap(tensor=tensor, affine=affine)
-        subject = torchio.Subject(image=image)  # to get transform history
-        transformed = self.getTransform()(subject)
-        deterministicApplied = transformed.get_applied_transforms()[0]
-        logging.info(f'Applied transform: {deterministicApplied}')
-        transformedImage = transformed.image
-        image = torchio.io.nib_to_sitk(transformedImage.data, transformedImage.affine)
-        su.PushVolumeToSlicer(image, targetNode=outputVolumeNode)
+        elif volumeNode.IsA('vtkMRMLScalarVolumeNode'):
+            image = torchio.ScalarImage(tensor=tensor, affine=affine)
+        return torchio.Subject(image=image)  # to get transform history
+
+    def setVolumeNodeFromImage(self, image, volumeNode):
+        import torchio
+        sitkImage = torchio.io.nib_to_sitk(image.data, image.affine)
+        su.PushVolumeToSlicer(sitkImage, targetNode=volumeNode)
+        return volumeNode
+
+    def getSweepKwargs(self, kwarg, value):
+        """Return the kwargs for one value of a sweep.
+
+        The swept range is collapsed to ``(value, value)`` and the other ranges
+        to their midpoints, so that only the swept argument changes.
+        """
+        kwargs = self.getKwargs()
+        for name, slider in self.rangeWidgets.items():
+            midpoint = (slider.minimumValue + slider.maximumValue) / 2
+            kwargs[name] = midpoint, midpoint
+        kwargs[kwarg] = value, value
+        return kwargs
+
+    def sweep(self, inputVolumeNode, kwarg, values, numWorkers=None):
+        """Apply the transform once per value of a range argument.
+
+        The input is converted only once and the transforms run in a thread
+        pool, as PyTorch releases the GIL in most operations. The widgets are
+        read here, in the main thread.
+        """
+        import torch
+        subject = self.getSubjectFromVolumeNode(inputVolumeNode)
+        klass = self.getTransformClass()
+        args = self.getArgs()
+        kwargsList = [self.getSweepKwargs(kwarg, value) for value in values]
+
+        def apply(kwargs):
+            return klass(*args, **kwargs)(subject).image
+
+        if self.sweepWithSeed:
+            seed = torch.seed()
+            images = []
+            for kwargs in kwargsList:
+                torch.manual_seed(seed)
+                images.append(apply(kwargs))
+        else:
+            if numWorkers is None:
+                numWorkers = self.getMaxWorkers(inputVolumeNode)
+            with ThreadPoolExecutor(max_workers=numWorkers) as executor:
+                images = list(executor.map(apply, kwargsList))
+        logging.info(f'Swept {self.name} {kwarg} over {values}')
+        return images
+
+    def getMemoryLimit(self):
+        limits = []
+        if self.memoryBudget is not None:
+            limits.append(self.memoryBudget)
+        available = getAvailableMemory()
+        if available is not None:
+            limits.append(self.availableMemoryFraction * available)
+        return min(limits) if limits else None
+
+    def estimatePeakMemory(self, numVoxels, itemSize, workingVoxels=None, workingSize=None):
+        """Estimate the peak memory in bytes needed to apply the transform.
+
+        The input stays in memory while the transform creates
+        ``memoryFactor`` copies of the region being transformed.
+        """
+        if workingVoxels is None:
+            workingVoxels = numVoxels
+        if workingSize is None:
+            workingSize = max(itemSize, 4)
+        return numVoxels * itemSize + workingVoxels * self.memoryFactor * workingSize
+
+    def getMaxWorkers(self, volumeNode):
+        imageData = volumeNode.GetImageData()
+        numVoxels = imageData.GetNumberOfPoints() * imageData.GetNumberOfScalarComponents()
+        estimate = self.estimatePeakMemory(numVoxels, imageData.GetScalarSize())
+        limit = self.getMemoryLimit()
+        maxWorkers = os.cpu_count() or 1
+        if limit is not None:
+            maxWorkers = min(maxWorkers, int(limit // estimate))
+        return max(1, maxWorkers)
+
+    def getRoiMargins(self, spacing):
+        """Return the margins in voxels per axis around the foreground for the "roi" strategy.
+
+        They must contain the neighborhood that each output voxel depends on.
+        """
+        return 3 * (self.roiMargin,)
+
+    def getForegroundBounds(self, volumeNode, margins=None):
+        """Return the bounding box of nonzero voxels, with a margin, in IJK order."""
+        if margins is None:
+            margins = 3 * (self.roiMargin,)
+        array = slicer.util.arrayFromVolume(volumeNode)  # KJI view, no copy
+        bounds = []
+        for axis, margin in zip((2, 1, 0), margins):
+            otherAxes = tuple(n for n in range(3) if n != axis)
+            indices = np.flatnonzero(np.any(array, axis=otherAxes))
+            size = array.shape[axis]
+            if len(indices) == 0:
+                bounds.append((0, size))
+                continue
+            first = max(0, indices[0] - margin)
+            last = min(size, indices[-1] + 1 + margin)
+            bounds.append((int(first), int(last)))
+        return bounds
+
+    def chooseStrategy(self, volumeNode):
+        """Choose how to apply the transform within the memory limit.
+
+        Strategies are tried from most to least faithful: full resolution,
+        single precision for 64-bit inputs, only the foreground bounding box
+        for local transforms, and slabs for pointwise transforms.
+        A ``MemoryError`` is raised if none of them fits.
+        """
+        imageData = volumeNode.GetImageData()
+        numVoxels = imageData.GetNumberOfPoints() * imageData.GetNumberOfScalarComponents()
+        itemSize = imageData.GetScalarSize()
+        limit = self.getMemoryLimit()
+        plan = {'strategy': 'full', 'estimate': self.estimatePeakMemory(numVoxels, itemSize)}
+        if limit is not None and plan['estimate'] > limit:
+            plan = self.getFallbackPlan(volumeNode, numVoxels, itemSize, limit, plan['estimate'])
+        limitString = 'unknown' if limit is None else formatBytes(limit)
+        logging.info(
+            f'Estimated peak memory for {self.name}: {formatBytes(plan["estimate"])}'
+            f' (limit: {limitString}). Strategy: {plan["strategy"]}'
+        )
+        return plan
+
+    def getFallbackPlan(self, volumeNode, numVoxels, itemSize, limit, fullEstimate):
+        if itemSize > 4:
+            estimate = self.estimatePeakMemory(numVoxels, itemSize, workingSize=4)
+            if estimate <= limit:
+                return {'strategy': 'reduced', 'estimate': estimate}
+        if self.isLocal:
+            margins = self.getRoiMargins(np.array(volumeNode.GetSpacing()))
+            bounds = self.getForegroundBounds(volumeNode, margins)
+            roiVoxels = int(np.prod([last - first for first, last in bounds]))
+            estimate = 4 * numVoxels + self.estimatePeakMemory(
+                numVoxels, itemSize, workingVoxels=roiVoxels, workingSize=4)
+            if estimate <= limit:
+                return {'strategy': 'roi', 'estimate': estimate, 'bounds': bounds}
+        if self.isPointwise:
+            sliceVoxels = numVoxels // volumeNode.GetImageData().GetDimensions()[2]
+            base = numVoxels * (itemSize + 4)
+            chunkSlices = int((limit - base) // (sliceVoxels * self.memoryFactor * 4))
+            if chunkSlices > 0:
+                return {
+                    'strategy': 'chunked',
+                    'estimate': base + chunkSlices * sliceVoxels * self.memoryFactor * 4,
+                    'chunkSlices': chunkSlices,
+                }
+        message = (
+            f'Applying {self.name} to a volume of {numVoxels} voxels would need'
+            f' about {formatBytes(fullEstimate)}, but the memory limit is'
+            f' {formatBytes(limit)}. Crop or resample the volume first, or'
+            ' increase the memory budget.'
+        )
+        raise MemoryError(message)
+
+    def getTransformedImage(self, subject, plan, transform=None):
+        """Apply the transform to a subject following a plan from ``chooseStrategy``.
+
+        The TorchIO transform can be passed to avoid reading the widgets, for
+        example when this is called from a worker thread.
+        """
+        import torchio
+        if transform is None:
+            transform = self.getTransform()
+        image = subject.image
+        strategy = plan['strategy']
+        if strategy in ('full', 'reduced'):
+            if strategy == 'reduced':
+                image.set_data(image.data.float())
+            transformed = transform(subject)
+            self.getDeterministicTransform(transformed)
+            return transformed.image
+        output = image.data.float()
+        if strategy == 'roi':
+            (i0, i1), (j0, j1), (k0, k1) = plan['bounds']
+            affine = image.affine.copy()
+            affine[:3, 3] = affine[:3, :3] @ (i0, j0, k0) + affine[:3, 3]
+            roiTensor = output[:, i0:i1, j0:j1, k0:k1].clone()  # a view would be deep-copied whole
+            roiImage = type(image)(tensor=roiTensor, affine=affine)
+            transformed = transform(torchio.Subject(image=roiImage))
+            self.getDeterministicTransform(transformed)
+            output[:, i0:i1, j0:j1, k0:k1] = transformed.image.data
+        elif strategy == 'chunked':
+            depth = output.shape[-1]
+            for start in range(0, depth, plan['chunkSlices']):
+                stop = start + plan['chunkSlices']
+                chunkTensor = output[..., start:stop].clone()
+                chunk = type(image)(tensor=chunkTensor, affine=image.affine)
+                transformed = transform(torchio.Subject(image=chunk))
+                if start == 0:
+                    transform = self.getDeterministicTransform(transformed)
+                output[..., start:stop] = transformed.image.data
+        return type(image)(tensor=output, affine=image.affine)
+
+    def getLabelMargin(self, roiSize, spacing, offset):
+        """Return the margin in mm per axis that contains the labels after the transform.
+
+        ``roiSize`` is the physical size of the bounding box of the labels and
+        ``offset`` the position of its center relative to the center of the
+        volume, in mm along each voxel axis. If None, the transform is applied
+        to the whole label map.
+        """
+        return None
+
+    def getLabelTransform(self):
+        """Return the transform applied to the bounding box of a label map.
+
+        The box is shifted so that the center of the whole volume is at the
+        origin of the world coordinates.
+        """
+        return self.getTransform()
+
+    def copyVolume(self, inputVolumeNode, outputVolumeNode):
+        if outputVolumeNode is inputVolumeNode:
+            return outputVolumeNode
+        imageData = vtk.vtkImageData()
+        imageData.DeepCopy(inputVolumeNode.GetImageData())
+        outputVolumeNode.SetAndObserveImageData(imageData)
+        outputVolumeNode.CopyOrientation(inputVolumeNode)
+        return outputVolumeNode
+
+    def applyToLabelMap(self, inputVolumeNode, outputVolumeNode):
+        """Apply the transform to a label map using compact integer types.
+
+        Intensity transforms do not modify label maps, so the input is copied.
+        Spatial transforms are applied only to the bounding box of the labels,
+        padded with the margin from ``getLabelMargin``, and the output is stored
+        with the smallest integer type that holds all labels. The box is placed
+        so that the center of the volume is at the origin, which lets
+        ``getLabelTransform`` keep the geometry of the whole volume.
+        """
+        crop = self.getLabelCrop(inputVolumeNode)
+        if crop is None:
+            logging.info(f'{self.name} does not modify this label map. Copying input')
+            self.lastAppliedTransform = None
+            return self.copyVolume(inputVolumeNode, outputVolumeNode)
+        outputArray = self.transformLabelCrop(crop)
+        return self.setLabelMapFromArray(outputArray, inputVolumeNode, outputVolumeNode)
+
+    def getLabelCrop(self, inputVolumeNode):
+        """Return the bounding box of the labels, or None if they would not be modified."""
+        import torch
+        import torchio
+        array = slicer.util.arrayFromVolume(inputVolumeNode)  # KJI view, no copy
+        maxLabel = int(array.max())
+        # Motion artifacts, for example, are simulated only on intensity images
+        isIntensity = issubclass(self.getTransformClass(), torchio.IntensityTransform)
+        if not self.isSpatial or isIntensity or maxLabel == 0:
+            return None
+        if array.min() < 0:
+            dtype = array.dtype
+        elif maxLabel < 2 ** 8:
+            dtype = np.uint8
+        elif maxLabel < 2 ** 15:  # PyTorch has limited support for uint16
+            dtype = np.int16
+        else:
+            dtype = np.int32
+        spacing = np.array(inputVolumeNode.GetSpacing())
+        labelBounds = self.getForegroundBounds(inputVolumeNode, margins=(0, 0, 0))
+        roiSize = spacing * [last - first for first, last in labelBounds]
+        centerIndex = (np.array(array.shape[::-1]) - 1) / 2
+        roiCenterIndex = [(first + last - 1) / 2 for first, last in labelBounds]
+        offset = spacing * (roiCenterIndex - centerIndex)
+        marginMm = self.getLabelMargin(roiSize, spacing, offset)
+        if marginMm is None:
+            bounds = [(0, size) for size in array.shape[::-1]]
+        else:
+            margins = np.ceil(np.asarray(marginMm) / spacing).astype(int) + 1
+            bounds = [
+                (max(0, first - margin), min(size, last + margin))
+                for (first, last), margin, size
+                in zip(labelBounds, margins, array.shape[::-1])
+            ]
+        (i0, i1), (j0, j1), (k0, k1) = bounds
+        roiArray = array[k0:k1, j0:j1, i0:i1].astype(dtype)
+        tensor = torch.from_numpy(np.ascontiguousarray(roiArray.transpose(2, 1, 0)))
+        matrix = vtk.vtkMatrix4x4()
+        inputVolumeNode.GetIJKToRASMatrix(matrix)
+        affine = slicer.util.arrayFromVTKMatrix(matrix)
+        affine[:3, 3] = affine[:3, :3] @ ((i0, j0, k0) - centerIndex)
+        return {
+            'label': torchio.LabelMap(tensor=tensor[np.newaxis], affine=affine),
+            'bounds': bounds,
+            'shape': array.shape,
+            'dtype': dtype,
+        }
+
+    def transformLabelCrop(self, crop, transform=None):
+        """Transform a crop from ``getLabelCrop`` and paste it into an empty KJI array.
+
+        The TorchIO transform can be passed to avoid reading the widgets, for
+        example when this is called from a worker thread.
+        """
+        import torchio
+        if transform is None:
+            transform = self.getLabelTransform()
+        transformed = transform(torchio.Subject(image=crop['label']))
+        self.getDeterministicTransform(transformed)
+        (i0, i1), (j0, j1), (k0, k1) = crop['bounds']
+        outputArray = np.zeros(crop['shape'], dtype=crop['dtype'])
+        transformedArray = transformed.image.data[0].numpy().transpose(2, 1, 0)
+        outputArray[k0:k1, j0:j1, i0:i1] = transformedArray
+        logging.info(
+            f'Transformed label region of shape {transformedArray.shape[::-1]}'
+            f' out of {crop["shape"][::-1]} as {np.dtype(crop["dtype"]).name}'
+        )
+        return outputArray
+
+    def setLabelMapFromArray(self, array, inputVolumeNode, outputVolumeNode):
+        slicer.util.updateVolumeFromArray(outputVolumeNode, array)
+        if outputVolumeNode is not inputVolumeNode:
+            outputVolumeNode.CopyOrientation(inputVolumeNode)
+        return outputVolumeNode
+
+    def getDeterministicTransform(self, transformed):
+        import torchio
+        appliedTransforms = transformed.get_applied_transforms()
+        logging.info(f'Applied transform: {appliedTransforms[0]}')
+        self.lastAppliedTransform = torchio.Compose(appliedTransforms)
+        return self.lastAppliedTransform
+
+    def replay(self, inputVolumeNode, outputVolumeNode, deterministicTransform):
+        subject = self.getSubjectFromVolumeNode(inputVolumeNode)
+        transformed = deterministicTransform(subject)
+        self.setVolumeNodeFromImage(transformed.image, outputVolumeNode)
+        return outputVolumeNode
+
+    def applyToSequence(self, inputSequenceNode, outputSequenceNode, framesPerBatch=1):
+        """Stream the frames of a sequence through the transform.
+
+        Frames are stacked as channels of a single image, ``framesPerBatch`` at
+        a time. The parameters sampled for the first batch are reused for the
+        rest, so all frames get the same augmentation. Each output frame is
+        copied into the output sequence as soon as it has been computed, so
+        only the current batch is held in memory. If both sequences are the
+        same node, frames are replaced in place.
+        """
+        import torch
+        import torchio
+        numFrames = inputSequenceNode.GetNumberOfDataNodes()
+        if outputSequenceNode is not inputSequenceNode:
+            outputSequenceNode.RemoveAllDataNodes()
+        outputSequenceNode.SetIndexName(inputSequenceNode.GetIndexName())
+        outputSequenceNode.SetIndexUnit(inputSequenceNode.GetIndexUnit())
+        outputSequenceNode.SetIndexType(inputSequenceNode.GetIndexType())
+        className = inputSequenceNode.GetNthDataNode(0).GetClassName()
+        frameNode = slicer.mrmlScene.AddNewNodeByClass(className)
+        transform = self.getTransform()
+        try:
+            for start in range(0, numFrames, framesPerBatch):
+                indices = range(start, min(start + framesPerBatch, numFrames))
+                images = [
+                    self.getSubjectFromVolumeNode(inputSequenceNode.GetNthDataNode(i)).image
+                    for i in indices
+                ]
+                first = images[0]
+                tensor = torch.cat([image.data for image in images])
+                del images
+                batch = torchio.Subject(image=type(first)(tensor=tensor, affine=first.affine))
+                transformed = transform(batch)
+                if start == 0:
+                    transform = self.getDeterministicTransform(transformed)
+                transformedImage = transformed.image
+                for channel, i in enumerate(indices):
+                    frame = type(first)(
+                        tensor=transformedImage.data[channel:channel + 1],
+                        affine=transformedImage.affine,
+                    )
+                    self.setVolumeNodeFromImage(frame, frameNode)
+                    indexValue = inputSequenceNode.GetNthIndexValue(i)
+                    outputSequenceNode.SetDataNodeAtValue(frameNode, indexValue)
+        finally:
+            slicer.mrmlScene.RemoveNode(frameNode)
+        logging.info(f'Transformed {numFrames} frames')
+        return outputSequenceNode
+
+    def __call__(
+            self,
+            inputVolumeNode,
+            outputVolumeNode,
+            framesPerBatch=1,
+            statistics=False,
+            difference=False,
+            absoluteDifference=False,
+            ):
+        """Apply the transform to a volume node and write the result to another.
+
+        If ``statistics`` is True, summary statistics and histograms of the
+        input and output are computed from samples of the tensors already in
+        memory and stored in ``lastStatistics``. If ``difference`` is True, the
+        (absolute) difference between output and input is stored as an image
+        in ``lastDifference``, or the reason why it could not be computed in
+        ``lastDifferenceError``. Both are only available for scalar volumes.
+        The way the transform was applied is stored in ``lastStrategy``; only
+        the ``'full'`` and ``'reduced'`` strategies can be replayed on the
+        input with ``lastAppliedTransform``.
+        """
+        self.lastStatistics = None
+        self.lastStrategy = None
+        self.lastDifference = None
+        self.lastDifferenceError = None
+        if inputVolumeNode.IsA('vtkMRMLSequenceNode') != outputVolumeNode.IsA('vtkMRMLSequenceNode'):
+            raise TypeError('Input and output must both be sequences or both be volumes')
+        isScalar = (
+            inputVolumeNode.IsA('vtkMRMLScalarVolumeNode')
+            and not inputVolumeNode.IsA('vtkMRMLLabelMapVolumeNode')
+        )
+        if difference and not isScalar:
+            self.lastDifferenceError = 'The difference is only computed for scalar volumes'
+        if inputVolumeNode.IsA('vtkMRMLSequenceNode'):
+            self.lastStrategy = 'sequence'
+            return self.applyToSequence(inputVolumeNode, outputVolumeNode, framesPerBatch)
+        if inputVolumeNode.IsA('vtkMRMLLabelMapVolumeNode'):
+            self.lastStrategy = 'label'
+            return self.applyToLabelMap(inputVolumeNode, outputVolumeNode)
+        plan = self.chooseStrategy(inputVolumeNode)
+        self.lastStrategy = plan['strategy']
+        subject = self.getSubjectFromVolumeNode(inputVolumeNode)
+        if statistics:
+            # Sampled before applying, as some strategies modify the input in place
+            inputSample = sampleVoxels(subject.image.data)
+        transformedImage = self.getTransformedImage(subject, plan)
+        if statistics:
+            outputSample = sampleVoxels(transformedImage.data)
+            self.lastStatistics = getSummaries(inputSample, outputSample)
+        if difference:
+            self.setDifference(subject.image, transformedImage, plan, absoluteDifference)
+        self.setVolumeNodeFromImage(transformedImage, outputVolumeNode)
         return outputVolumeNode
+
+    def setDifference(self, inputImage, outputImage, plan, absolute=False):
+        import torch
+        import torchio
+        if plan['strategy'] not in ('full', 'reduced'):
+            self.lastDifferenceError = (
+                f'The difference is not computed, as the input is not kept'
+                f' with the "{plan["strategy"]}" memory strategy'
+            )
+        elif inputImage.shape != outputImage.shape:
+            self.lastDifferenceError = 'The difference is not computed, as the shapes differ'
+        if self.lastDifferenceError is not None:
+            logging.warning(self.lastDifferenceError)
+            return
+        difference = outputImage.data.to(torch.float32, copy=True)
+        difference -= inputImage.data
+        if absolute:
+            difference.abs_()
+        self.lastDifference = torchio.ScalarImage(tensor=difference, affine=outputImage.affine)